@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Memory and time benchmark of Repository.iter_changesets, the streaming
+# classification used by the revtree tables synchronization, on a synthetic
+# Subversion repository.
+#
+# Usage: python benchmarks/bench_build.py [revisions] [branches]
+
+# REMARK: revtree.db is loaded before revtree.model, as by the plugin entry
+#         points, revtree.model depending on revtree.db
+from revtree.db import DBUpdater
+from revtree.model import Repository
+from trac.test import EnvironmentStub
+from trac.versioncontrol import Changeset, Node
+import re
+import resource
+import sys
+import time
+
+
+BRANCH_RE = re.compile(r'^(?:(?P<branch>trunk|(?:branches|sandboxes|vendor)/'
+                       r'(?P<branchname>[^/]+))|'
+                       r'(?P<tag>tags/(?P<tagname>[^/]+)))(?:/(?P<path>.*))?$')
+
+
+def rss():
+    """Returns the maximum resident set size, in kilobytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ChangesetStub(object):
+
+    def __init__(self, rev, branches):
+        self.rev = rev
+        self.branches = branches
+        self.author = u'author%d' % (rev % 50)
+        self.date = None
+
+    def get_changes(self):
+        yield (u'branches/b%d/file' % (self.rev % self.branches), Node.FILE,
+               Changeset.EDIT, None, None)
+
+
+class SvnRepositoryStub(object):
+
+    def __init__(self, revisions, branches):
+        self.revisions = revisions
+        self.branches = branches
+
+    def get_oldest_rev(self):
+        return 1
+
+    def get_youngest_rev(self):
+        return self.revisions
+
+    def get_changeset(self, rev):
+        return ChangesetStub(rev, self.branches)
+
+    def next_rev(self, rev):
+        return rev + 1 if rev < self.revisions else None
+
+
+def main(revisions, branches):
+    env = EnvironmentStub()
+    svnrepos = SvnRepositoryStub(revisions, branches)
+    Repository.get_svn_repository = classmethod(lambda cls, env: svnrepos)
+    repos = Repository(env)
+
+    start = time.time()
+    for idx, chgset in enumerate(repos.iter_changesets(BRANCH_RE)):
+        if idx % (revisions / 4) == 0:
+            print "%d revisions: RSS %d kB" % (idx, rss())
+    elapsed = time.time() - start
+
+    print "%d revisions, %d branches: %.3f s, RSS %d kB" % \
+        (revisions, branches, elapsed, rss())
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 500)
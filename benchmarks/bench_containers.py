@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Memory and time benchmark of the materialization of RevisionEntry rows, as
+# done by DBInterface.get_revisions.
+#
+# Usage: python benchmarks/bench_containers.py [rows]
+
+from revtree.containers import RevisionEntry
+import resource
+import sys
+import time
+
+
+def rss():
+    """Returns the maximum resident set size, in kilobytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main(rows):
+    data = [(rev, u'branches/b%d' % (rev % 500), u'b%d' % (rev % 500),
+             u'author%d' % (rev % 50), 1400000000 + rev * 60, u'False',
+             u'None', 0) for rev in xrange(rows)]
+
+    before = rss()
+    start = time.time()
+    entries = [RevisionEntry().set(*row) for row in data]
+    elapsed = time.time() - start
+    growth = rss() - before
+
+    print "%d entries: %.3f s, %.2f us per entry" % \
+        (len(entries), elapsed, elapsed * 1e6 / rows)
+    print "RSS growth: %d kB, %.1f bytes per entry" % \
+        (growth, growth * 1024. / rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Micro-benchmark of the QueryFilter per revision evaluation cost, i.e. the
+# Python fallback used when clauses are not evaluated by the database.
+#
+# Usage: python benchmarks/bench_queryfilter.py [rows]
+
+from revtree.web_ui import QueryFilter
+from trac.test import EnvironmentStub
+import sys
+import time
+
+
+class RepositoryStub(object):
+    pass
+
+
+def main(rows):
+    env = EnvironmentStub()
+    timebase = int(time.time())
+    query_info = {'0_author': ['alice', 'bob'],
+                  '0_period': '14',
+                  '1_date': ['2015-01-01', '2015-12-31'],
+                  '1_branch': 'trunk',
+                  '2_revision': ['100', '200']}
+
+    start = time.time()
+    query = QueryFilter(env, RepositoryStub(), query_info, timebase)
+    build = time.time() - start
+
+    authors = ['alice', 'bob', 'carol']
+    branches = ['trunk', 'branches/b1']
+    start = time.time()
+    for rev in xrange(rows):
+        query.eval(branch=branches[rev % 2],
+                   authors=[authors[rev % 3]],
+                   revision=rev,
+                   date=timebase - rev * 60,
+                   deleted=rev % 7 == 0)
+    elapsed = time.time() - start
+
+    print "QueryFilter build: %.3f ms" % (build * 1e3)
+    print "%d revisions: %.3f s, %.2f us per revision" % \
+        (rows, elapsed, elapsed * 1e6 / rows)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
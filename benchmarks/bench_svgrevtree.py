@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Benchmark of SvgRevtree.create on a synthetic repository, every revision
+# being displayed, with a tag every 100 revisions.
+#
+# Usage: python benchmarks/bench_svgrevtree.py [revisions] [branches]
+
+from revtree.svgview import SvgRevtree
+from trac.test import EnvironmentStub
+import random
+import sys
+import time
+
+
+class BranchStub(object):
+
+    def __init__(self, name):
+        self.branch = name
+        self.name = name
+        self.revisions = []
+
+    @property
+    def firstrev(self):
+        return self.revisions[-1]
+
+    @property
+    def lastrev(self):
+        return self.revisions[0]
+
+    def get_revisions(self, revrange=None):
+        if not revrange:
+            return self.revisions
+        return [rev for rev in self.revisions
+                if revrange[0] <= rev <= revrange[1]]
+
+
+class TagStub(object):
+
+    def __init__(self, rev):
+        self.revision = rev
+        self.name = 'tags/t%d' % rev
+        self.prettyname = 't%d' % rev
+
+
+class RepositoryStub(object):
+
+    def __init__(self, revisions, branches):
+        self.branches = dict(('branches/b%d' % idx,
+                              BranchStub('branches/b%d' % idx))
+                             for idx in xrange(branches))
+        names = sorted(self.branches)
+        random.seed(0)
+        self.revisions = []
+        for rev in xrange(revisions, 0, -1):
+            branch = self.branches[random.choice(names)]
+            branch.revisions.append(rev)
+            self.revisions.append((rev, random.choice([None, 0, 1])))
+
+    def get_branch(self, name):
+        return [self.branches[name]]
+
+    def get_revision_firstrev(self, rev):
+        return None
+
+    def get_tags(self):
+        return [TagStub(rev) for rev, clause in self.revisions[::100]]
+
+
+def main(revisions, branches):
+    env = EnvironmentStub()
+    repos = RepositoryStub(revisions, branches)
+    svgbranches = set(name for name, branch in repos.branches.iteritems()
+                      if branch.revisions)
+
+    svgrevtree = SvgRevtree(env, repos, '/trac', [], None)
+    start = time.time()
+    svgrevtree.create(None, svgbranches, repos.revisions, set(), 'compact')
+    elapsed = time.time() - start
+
+    print "%d revisions, %d branches: create %.3f s" % \
+        (revisions, len(svgbranches), elapsed)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 500)
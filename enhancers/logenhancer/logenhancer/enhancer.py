@@ -75,9 +75,8 @@ class LogEnhancer(RevtreeEnhancer):
                 branchsrc = svgsrc.branch()
 
                 # filter available revision for branch source
-                branchsrc_rev = filter(lambda r: (revrange[0] <= r <= revrange[1]) \
-                                       and (r not in filtered_revisions),
-                                       branchsrc.get_revisions())
+                branchsrc_rev = set(r for r in branchsrc.get_revisions(revrange)
+                                    if r not in filtered_revisions)
 
                 brrevs = [r for r in revs if r in branchsrc_rev]
                 if not brrevs:
@@ -118,9 +117,8 @@ class LogEnhancer(RevtreeEnhancer):
                 branchsrc = svgsrc.branch()
 
                 # filter available revision for branch source
-                branchsrc_rev = filter(lambda r: revrange[0] <= r <= revrange[1] \
-                                       and (r not in filtered_revisions),
-                                       branchsrc.get_revisions())
+                branchsrc_rev = set(r for r in branchsrc.get_revisions(revrange)
+                                    if r not in filtered_revisions)
 
                 brrevs = [r for r in revs if r in branchsrc_rev]
                 if not brrevs:
@@ -86,9 +86,8 @@ class MergeInfoEnhancer(RevtreeEnhancer):
                (branch.terminalrev not in self._filtered_revisions):
                 svgbranch.svgchangeset(branch.terminalrev).mark_last()
 
-            chgsets = [rev for rev in branch.get_revisions() \
-                       if (revrange[0] <= rev <= revrange[1]) and
-                       (rev not in self._filtered_revisions)]
+            chgsets = [rev for rev in branch.get_revisions(revrange)
+                       if rev not in self._filtered_revisions]
             chgsets.sort()
 
             # Get source branch merge information if any
@@ -144,9 +143,8 @@ class MergeInfoEnhancer(RevtreeEnhancer):
                             continue
 
                         srcbrc = svgsrcbranch.branch()
-                        srcrevs = srcbrc.get_revisions()
+                        srcrevs = srcbrc.get_revisions((s1, s2))
                         srcrevs.sort()
-                        srcrevs = filter(lambda x: s1 <= x <= s2, srcrevs)
                         if not srcrevs:
                             continue
 
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 
-from revtree.db.db import DBUpdater
-from trac.admin.api import IAdminCommandProvider
+from revtree.db.db import DBComponent, DBUpdater
+from trac.admin.api import AdminCommandError, IAdminCommandProvider
 from trac.config import Option
 from trac.core import Component, implements
+from trac.util.text import printout
 import re
+import time
 
 
 class RevTreeAdmin(Component):
@@ -31,15 +33,68 @@ class RevTreeAdmin(Component):
 
     # IAdminCommandProvider methods
     def get_admin_commands(self):
-        yield ('revtree resync', '',
-               """Resynchronize revtree tables""",
+        yield ('revtree resync', '[--jobs N]',
+               """Resynchronize revtree tables
+
+               With --jobs, changesets are classified by N worker processes.
+               """,
                None, self._do_resync)
 
         yield ('revtree droptables', '', """Drop revtree tables""",
                None, self._do_drop_tables)
 
-    def _do_resync(self):
-        self._db_updater.sync(revrange=None)
+        yield ('revtree worker', '[--once]',
+               """Synchronize the revisions queued by the post-commit hook
+
+               Runs until interrupted, or until the queue is empty with
+               --once. Only one worker should run per environment.
+               """,
+               None, self._do_worker)
+
+    def _do_resync(self, *args):
+        jobs = 1
+        if args:
+            if len(args) != 2 or args[0] != '--jobs' or \
+                    not args[1].isdigit() or int(args[1]) < 1:
+                raise AdminCommandError('Invalid arguments', show_usage=True,
+                                        cmd='revtree resync')
+            jobs = int(args[1])
+
+        self._db_updater.sync(revrange=None, jobs=jobs)
+        printout("Synchronized %s" % self._db_updater.session.summary())
+        self._check_sync_gaps()
+
+    def _check_sync_gaps(self):
+        """Fails the command if some revision ranges could not be
+           synchronized"""
+        _, gaps = self._db_updater.get_sync_state()
+        if gaps:
+            raise AdminCommandError('Revision ranges not synchronized, see '
+                                    'the log for details: %s' %
+                                    ', '.join('%d-%d' % rng for rng in gaps))
 
     def _do_drop_tables(self):
         self._db_updater.droptables()
+
+    def _do_worker(self, *args):
+        if args and args != ('--once', ):
+            raise AdminCommandError('Invalid arguments', show_usage=True,
+                                    cmd='revtree worker')
+        once = bool(args)
+
+        db_component = DBComponent(self.env)
+        try:
+            while True:
+                count = self._db_updater.process_sync_queue(
+                    db_component.sync_queue_batch_size,
+                    db_component.sync_retry_delay,
+                    db_component.sync_queue_max_attempts)
+                if count:
+                    printout("%d queued revisions, synchronized %s" %
+                             (count, self._db_updater.session.summary()))
+                elif once:
+                    break
+                else:
+                    time.sleep(db_component.sync_queue_poll_interval)
+        except KeyboardInterrupt:
+            pass
@@ -1,19 +1,44 @@
 # -*- coding: utf-8 -*-
+from array import array
 from trac.util.text import to_unicode
 
 
+def _parse_revisions(value):
+    """ Returns the comma separated revisions of value as a sorted array """
+    return array('i', sorted(int(r) for r in value.split(',')))
+
+
+class StructContainerType(type):
+
+    """ Metaclass of the data containers, fields defined through _field_names
+    class attribute are stored in slots rather than in an instance dict """
+
+    def __new__(mcs, name, bases, namespace):
+        inherited = set()
+        for base in bases:
+            inherited.update(getattr(base, '_field_names', []))
+        fields = [k for k in namespace.get('_field_names', [])
+                  if k not in inherited]
+        namespace['__slots__'] = tuple(fields) + \
+            tuple(namespace.get('__slots__', ()))
+        return super(StructContainerType, mcs).__new__(mcs, name, bases,
+                                                       namespace)
+
+
 class StructContainer(object):
 
     """ Data container, C structure style fields are define through _field_names
     class attribute, in init method fields are inited with corresponding kwargs
     value if any else None value is affected to the field """
+    __metaclass__ = StructContainerType
+
     _field_names = []
 
     def __init__(self, **kwargs):
         """ Init method. """
         super(StructContainer, self).__init__()
         for k in self._field_names:
-            self.__dict__[k] = kwargs.get(k, None)
+            setattr(self, k, kwargs.get(k, None))
 
     def update(self, **kwargs):
         """
@@ -22,13 +47,7 @@ class StructContainer(object):
         """
         for key in self._field_names:
             if key in kwargs:
-                self.__dict__[key] = kwargs.get(key)
-
-    def __setattr__(self, name, value):
-        if name not in self._field_names:
-            raise Exception("Attribute='%s' do not exist" % name)
-        self.__dict__[name] = value
-        return value
+                setattr(self, key, kwargs.get(key))
 
     def sql_fmt(self):
         return ", ".join(['%s' for _ in self._field_names])
@@ -36,47 +55,79 @@ class StructContainer(object):
     def sql_data(self):
         data = []
         for name in self._field_names:
-            if self.__dict__[name] is None:
+            value = getattr(self, name)
+            if value is None:
                 data.append(None)
             else:
-                data.append(to_unicode(self.__dict__[name]))
+                data.append(to_unicode(value))
         return data
 
     def set(self, *args):
         for n, v in zip(self._field_names, args):
 #             if isinstance(v, str):
 #                 v = to_unicode(v)  # Convert to unicode object
-            self.__dict__[n] = v
+            setattr(self, n, v)
         return self
 
-    def get_revisions(self):
-        return sorted([int(r) for r in self.revisions.split(',')],
-                      reverse=True)
-
 
 class RevisionEntry(StructContainer):
     _field_names = ['revision', 'branch', 'branch_name', 'author', 'date',
-                    'last', 'clone']
+                    'last', 'clone', 'deleted']
 
 
 class BranchEntry(StructContainer):
     _field_names = ['branch', 'name', 'date', 'firstrev', 'lastrev',
-                    'revisions', 'srcpath', 'srcrev', 'terminalrev']
+                    'srcpath', 'srcrev', 'terminalrev']
+    __slots__ = ('_db_itf', '_revisions')
+
+    def __init__(self, db_itf=None, **kwargs):
+        super(BranchEntry, self).__init__(**kwargs)
+        # Database interface, used to query the branch revisions
+        self._db_itf = db_itf
+        # Arrays of the branch revisions in reversed order, by queried range
+        self._revisions = {}
+
+    def get_revisions(self, revrange=None):
+        """ Returns the branch revisions in reversed order, restricted to
+        the (first, last) revrange if any """
+        key = tuple(revrange) if revrange else None
+        revisions = self._revisions.get(key)
+        if revisions is None:
+            revisions = array('i', self._db_itf.get_branch_revisions(
+                self.firstrev, key))
+            self._revisions[key] = revisions
+        return revisions.tolist()
 
 
 class TagEntry(StructContainer):
     _field_names = ['name', 'prettyname', 'tag_revision', 'branch', 'revision']
 
 
+class ChangesetEntry(StructContainer):
+    """ Classified branch changeset, as written to the revtree tables """
+    _field_names = ['rev', 'branchname', 'prettyname', 'author', 'date',
+                    'last', 'clone', 'bring', 'deliver']
+
+
 class DeliverEntry(StructContainer):
     _field_names = ['branch', 'revision', 'deliver']
+    __slots__ = ('_revisions', )
 
     def get_revisions(self):
-        return sorted([int(r) for r in self.deliver.split(',')], reverse=True)
+        """ Returns the delivered revisions in reversed order """
+        # REMARK: parsed value is kept with its source string
+        if getattr(self, '_revisions', (None, ))[0] is not self.deliver:
+            self._revisions = (self.deliver, _parse_revisions(self.deliver))
+        return self._revisions[1].tolist()[::-1]
 
 
 class BringEntry(StructContainer):
     _field_names = ['branch', 'revision', 'bring']
+    __slots__ = ('_revisions', )
 
     def get_revisions(self):
-        return sorted([int(r) for r in self.bring.split(',')], reverse=True)
+        """ Returns the brought revisions in reversed order """
+        # REMARK: parsed value is kept with its source string
+        if getattr(self, '_revisions', (None, ))[0] is not self.bring:
+            self._revisions = (self.bring, _parse_revisions(self.bring))
+        return self._revisions[1].tolist()[::-1]
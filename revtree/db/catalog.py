@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from revtree.db.db import DBComponent
+from revtree.db.db_itf import DBInterface
+from trac.core import Component
+import threading
+
+
+class RevtreeCatalog(Component):
+    """In-memory catalog of the revtree metadata: branches, tags and
+    authors.
+
+    The catalog is shared by the requests of the environment, and reloaded
+    when the revtree sync generation changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._generation = None
+        self._branches = []
+        self._tags = []
+        self._authors = []
+
+    def _refresh(self):
+        """Reloads the catalog if revtree tables have been synchronized
+           since the last refresh"""
+        generation = DBComponent(self.env).get_sync_generation()
+        with self._lock:
+            if generation == self._generation:
+                return
+            db_itf = DBInterface(self.env)
+            self._branches = db_itf.get_branch_names_with_prop()
+            self._tags = list(db_itf.get_tags())
+            self._authors = db_itf.get_authors()
+            self._generation = generation
+
+    def get_branches(self):
+        """Returns the list of (branch, terminalrev) of the branches"""
+        self._refresh()
+        return self._branches
+
+    def get_tags(self):
+        """Returns the list of TagEntry of the tags"""
+        self._refresh()
+        return self._tags
+
+    def get_authors(self):
+        """Returns the list of authors"""
+        self._refresh()
+        return self._authors
@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 
-from revtree.containers import BranchEntry
+from revtree.api import EmptyRangeError
+from revtree.containers import BranchEntry, ChangesetEntry
 from revtree.db.shema import db_version, schema
 from revtree.model import Repository
 from trac.util.text import to_unicode
+from trac.config import BoolOption, IntOption
 from trac.core import Component, implements, TracError
-from trac.db import DatabaseManager
+from trac.db import DatabaseManager, Table, Column, Index
 from trac.db.api import _parse_db_str
-from trac.env import IEnvironmentSetupParticipant
+from trac.env import IEnvironmentSetupParticipant, open_environment
 from trac.util.datefmt import to_timestamp
+import multiprocessing
+import re
+import time
 import traceback
 
 
@@ -16,6 +21,85 @@ def _db_to_version(name):
     return int(name.lstrip('db'))
 
 
+def _merge_ranges(ranges):
+    """Merges overlapping or contiguous (first, last) revision ranges"""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _format_ranges(ranges):
+    return ','.join('%d-%d' % rng for rng in ranges)
+
+
+def _parse_ranges(value):
+    return [tuple(int(r) for r in rng.split('-'))
+            for rng in value.split(',') if rng]
+
+
+def _changeset_row(vc, properties=True):
+    """Returns the ChangesetEntry fields of a branch changeset, without
+       brings and delivers if properties is False"""
+    # REMARK: revision properties are read from Subversion, once per
+    #         changeset
+    return (int(vc.rev),
+            to_unicode(vc.branchname),
+            to_unicode(vc.prettyname),
+            to_unicode(vc.changeset.author),
+            to_timestamp(vc.date),
+            vc.last,
+            vc.clone,
+            vc.prop('rth:bring') if properties else '',
+            vc.prop('rth:deliver') if properties else '')
+
+
+def _tag_row(tag):
+    return (to_unicode(tag.name),
+            to_unicode(tag.prettyname),
+            tag.rev,
+            to_unicode(tag.clone[1]),
+            tag.clone[0])
+
+
+# Environment of a resync worker process
+_worker_env = None
+
+
+def _init_worker(path):
+    global _worker_env
+    _worker_env = open_environment(path)
+
+
+def _classify_revrange(args):
+    """Classifies the changesets of a revision range in a resync worker
+       process. Returns the branch changesets rows, sorted by revision, and
+       the (rev, name, last, tag row) tag tuples.
+    """
+    branchre, revrange = args
+    repos = Repository(_worker_env)
+    properties = DBComponent(_worker_env).sync_revision_properties
+    changesets = []
+    try:
+        for vc in repos.iter_changesets(re.compile(branchre), revrange):
+            if vc.branchname:
+                changesets.append(_changeset_row(vc, properties))
+    except EmptyRangeError:
+        return [], []
+    except:
+        _worker_env.log.error('revtree classification error %s' %
+                              traceback.format_exc())
+        raise
+
+    tags = [(int(tag.rev), tag.name, tag.last,
+             None if tag.last else _tag_row(tag))
+            for tag in repos.tags().values()]
+    return changesets, tags
+
+
 class DBMixing(object):
     def droptables(self):
         self.env.log.debug('Drop Revtree tables')
@@ -30,9 +114,13 @@ class DBMixing(object):
         else:
             raise TracError('DB scheme "%s" is not managed' % scheme)
 
-        # Delete scheme revision
-        self.env.db_transaction("DELETE FROM system WHERE name=%s",
-                                (self.plugin_name + '_version', ))
+        # Delete scheme revision and synchronization state
+        # REMARK: the synchronization generation is kept, so that it remains
+        #         monotonic for the caches of running processes
+        self.env.db_transaction("DELETE FROM system WHERE name LIKE %s "
+                                "AND name<>%s",
+                                (self.plugin_name + '_%',
+                                 self.plugin_name + '_sync_generation'))
 
         # Drop tables
         rows = self.env.db_query(table_sql)
@@ -43,14 +131,16 @@ class DBMixing(object):
                 raise TracError("DB Revtree tables can not be dropped " \
                                 "exception='%s" % str(excpt))
 
-    def upgrade_environment(self, db):
-        # Drop tables
-        self.droptables()
+        self.bump_sync_generation(rewrite=True)
 
+    def upgrade_environment(self, db):
         installed = self.get_installed_version(db)
 
         # No tables
         if installed is None:
+            # Drop remaining tables, if any
+            self.droptables()
+
             self.env.log.info('Installing Revtree plugin schema %s' % db_version)
             db_connector, _ = DatabaseManager(self.env)._get_connector()
             with self.env.db_transaction as db:
@@ -75,6 +165,80 @@ class DBMixing(object):
                     installed = version
                 self.env.log.info('Upgrade to %s successful.' % version)
 
+    def db2(self, env, cursor):
+        """Move branch revisions to the revtree_branch_revisions table."""
+        db_connector, _ = DatabaseManager(env)._get_connector()
+
+        cursor.execute("CREATE TEMPORARY TABLE revtree_branches_old AS "
+                       "SELECT * FROM revtree_branches")
+        cursor.execute("DROP TABLE revtree_branches")
+
+        tables = [
+            Table('revtree_branches')[
+                Column('branch'),
+                Column('name'),
+                Column('date', type='int64'),
+                Column('firstrev', type='int'),
+                Column('lastrev', type='int'),
+                Column('srcpath'),
+                Column('srcrev', type='int'),
+                Column('terminalrev', type='int'),
+                Index(['branch'])],
+            Table('revtree_branch_revisions', key=('firstrev', 'revision'))[
+                Column('firstrev', type='int'),
+                Column('revision', type='int'),
+                Index(['revision'])],
+        ]
+        for table in tables:
+            for stmt in db_connector.to_sql(table):
+                cursor.execute(stmt)
+
+        cursor.execute("INSERT INTO revtree_branches (branch, name, date, "
+                       "firstrev, lastrev, srcpath, srcrev, terminalrev) "
+                       "SELECT branch, name, date, firstrev, lastrev, "
+                       "srcpath, srcrev, terminalrev "
+                       "FROM revtree_branches_old")
+
+        cursor.execute("SELECT firstrev, revisions FROM revtree_branches_old")
+        rows = [(int(firstrev), int(rev))
+                for firstrev, revisions in cursor.fetchall() if revisions
+                for rev in revisions.split(',')]
+        cursor.executemany("INSERT INTO revtree_branch_revisions "
+                           "(firstrev, revision) VALUES (%s, %s)", rows)
+
+        cursor.execute("DROP TABLE revtree_branches_old")
+
+    def db3(self, env, cursor):
+        """Add revtree_revisions indexes used by filter queries."""
+        for column in ('revision', 'date', 'author', 'branch'):
+            cursor.execute("CREATE INDEX revtree_revisions_%s_idx "
+                           "ON revtree_revisions (%s)" % (column, column))
+
+    def db4(self, env, cursor):
+        """Add revtree_revisions deleted branch flag."""
+        cursor.execute("ALTER TABLE revtree_revisions ADD COLUMN deleted "
+                       "integer")
+        cursor.execute("UPDATE revtree_revisions SET deleted=0")
+        cursor.execute("UPDATE revtree_revisions SET deleted=1 "
+                       "WHERE revision IN (SELECT r.revision "
+                       "FROM revtree_branch_revisions r "
+                       "INNER JOIN revtree_branches b "
+                       "ON b.firstrev=r.firstrev "
+                       "WHERE b.terminalrev IS NOT NULL)")
+
+    def db5(self, env, cursor):
+        """Add revtree_sync_queue table of the revisions to synchronize."""
+        db_connector, _ = DatabaseManager(env)._get_connector()
+
+        table = Table('revtree_sync_queue', key='id')[
+            Column('id', auto_increment=True),
+            Column('revision', type='int'),
+            Column('time', type='int64'),
+            Column('attempts', type='int'),
+            Column('retry', type='int64')]
+        for stmt in db_connector.to_sql(table):
+            cursor.execute(stmt)
+
     def get_installed_version(self, db):
         version = self.get_system_value(db, self.plugin_name + '_version', -1)
         return int(version) if version else None
@@ -94,6 +258,95 @@ class DBMixing(object):
     def set_installed_version(self, db, version):
         self.set_system_value(db, self.plugin_name + '_version', version)
 
+    def get_sync_state(self):
+        """Returns the synchronization high-water mark revision, or None if
+           unknown, and the list of (first, last) revision ranges below the
+           mark which failed to synchronize.
+        """
+        hwm = self.get_system_value(None, self.plugin_name + '_sync_rev')
+        gaps = self.get_system_value(None, self.plugin_name + '_sync_gaps')
+        return (int(hwm) if hwm else None), _parse_ranges(gaps or '')
+
+    def set_sync_state(self, hwm, gaps):
+        self.set_system_value(None, self.plugin_name + '_sync_rev', hwm)
+        self.set_system_value(None, self.plugin_name + '_sync_gaps',
+                              _format_ranges(gaps))
+
+    def get_sync_generation(self):
+        """Returns the synchronization generation, increased each time the
+           revtree tables are modified.
+        """
+        generation = self.get_system_value(None, self.plugin_name +
+                                           '_sync_generation')
+        return int(generation) if generation else 0
+
+    def get_rewrite_generation(self):
+        """Returns the synchronization generation of the last update of
+           already synchronized revisions, 0 if none.
+        """
+        generation = self.get_system_value(None, self.plugin_name +
+                                           '_sync_rewrite')
+        return int(generation) if generation else 0
+
+    def bump_sync_generation(self, rewrite=False):
+        """Increases the synchronization generation, rewrite telling
+           whether already synchronized revisions have been updated.
+        """
+        generation = self._increment_generation()
+        if rewrite:
+            self.set_system_value(None, self.plugin_name + '_sync_rewrite',
+                                  generation)
+        return generation
+
+    def _increment_generation(self):
+        key = self.plugin_name + '_sync_generation'
+        with self.env.db_transaction as db:
+            cursor = db.cursor()
+            # REMARK: single statement increment, so that concurrent syncs
+            #         never record the same generation
+            cursor.execute("UPDATE system SET value=%s+1 WHERE name=%%s" %
+                           db.cast('value', 'int'), (key,))
+            cursor.execute("SELECT value FROM system WHERE name=%s", (key,))
+            row = cursor.fetchone()
+            if not row:
+                cursor.execute("INSERT INTO system(name, value) "
+                               "VALUES(%s, %s)", (key, '1'))
+                return 1
+        return int(row[0])
+
+    def enqueue_sync(self, rev):
+        """Queues a revision to be synchronized by the revtree worker"""
+        self.env.db_transaction("INSERT INTO revtree_sync_queue (revision, "
+                                "time, attempts, retry) "
+                                "VALUES (%s, %s, 0, 0)",
+                                (int(rev), int(time.time())))
+
+    def get_sync_queue(self, limit):
+        """Returns the (id, revision, attempts) of the queued revisions due
+           for synchronization, at most limit, sorted by revision"""
+        return self.env.db_query("SELECT id, revision, attempts "
+                                 "FROM revtree_sync_queue WHERE retry<=%s "
+                                 "ORDER BY revision, id LIMIT %s",
+                                 (int(time.time()), limit))
+
+    def dequeue_sync(self, ids):
+        with self.env.db_transaction as db:
+            cursor = db.cursor()
+            cursor.executemany("DELETE FROM revtree_sync_queue WHERE id=%s",
+                               [(id_, ) for id_ in ids])
+
+    def defer_sync(self, rows, delay):
+        """Postpones the synchronization of the (id, revision, attempts)
+           queued rows, the delay being doubled on each failed attempt"""
+        now = int(time.time())
+        with self.env.db_transaction as db:
+            cursor = db.cursor()
+            cursor.executemany("UPDATE revtree_sync_queue SET attempts=%s, "
+                               "retry=%s WHERE id=%s",
+                               [(attempts + 1,
+                                 now + delay * 2 ** min(attempts, 6), id_)
+                                for id_, _, attempts in rows])
+
     def get_system_value(self, db, key, default=None):
         with self.env.db_query as db:
             cursor = db.cursor()
@@ -114,6 +367,123 @@ class DBMixing(object):
                     (key, value))
 
 
+class SyncSession(object):
+    """Synchronization of revision ranges of the revtree tables, all ranges
+       sharing one repository handle. The time spent in each phase is
+       recorded in timings:
+        - classify: reading and classification of the changesets
+        - write: revisions and branches tables update
+        - tags: tags table update
+    """
+
+    phases = ('classify', 'write', 'tags')
+
+    def __init__(self, updater):
+        self.updater = updater
+        self.env = updater.env
+        self.repos = Repository(updater.env)
+        # Number of synchronized revisions
+        self.count = 0
+        # Revision ranges which failed to synchronize
+        self.failed = []
+        # Seconds spent per phase
+        self.timings = dict((phase, 0.) for phase in self.phases)
+        self._start = time.time()
+
+    def _lap(self, phase, since):
+        now = time.time()
+        self.timings[phase] += now - since
+        return now
+
+    def elapsed(self):
+        return time.time() - self._start
+
+    def summary(self):
+        elapsed = self.elapsed()
+        return "%d revisions in %.1fs (%.1f rev/s): %s" % \
+            (self.count, elapsed, self.count / elapsed if elapsed else 0,
+             ', '.join('%s %.1fs' % (phase, self.timings[phase])
+                       for phase in self.phases))
+
+    def sync_range(self, revrange):
+        """Synchronizes a revision range, the whole repository if revrange
+           is None, with one streaming build of the repository.
+        """
+        self.env.log.debug("Synchronize for revision range='%s'" % \
+                           str(revrange))
+        updater = self.updater
+
+        # REMARK: changesets are classified and written as they are read
+        #         from the repository, chunk by chunk in revision order, so
+        #         that only one chunk is held in memory
+        clock = time.time()
+        chunk = []
+        for vc in self.repos.iter_changesets(updater.bcre, revrange):
+            if not vc.branchname:
+                continue
+            chunk.append(ChangesetEntry().set(
+                *_changeset_row(vc, updater.revision_properties)))
+            if len(chunk) == updater.chunk_size:
+                clock = self._lap('classify', clock)
+                self.count += updater._sync_chunk(chunk)
+                clock = self._lap('write', clock)
+                chunk = []
+        clock = self._lap('classify', clock)
+        if chunk:
+            self.count += updater._sync_chunk(chunk)
+            clock = self._lap('write', clock)
+
+        # Build tags table, once deleted tags have been dropped
+        updater._sync_tags([_tag_row(tag) for tag in
+                            self.repos.tags().values() if not tag.last])
+        self._lap('tags', clock)
+
+    def sync_parallel(self, revrange, jobs):
+        """Synchronizes a revision range, whose changesets are classified
+           chunk by chunk by a pool of jobs worker processes. Results are
+           written in revision order by the calling process.
+        """
+        updater = self.updater
+        chunks = [(updater.bcre.pattern,
+                   (rev, min(rev + updater.chunk_size - 1, revrange[1])))
+                  for rev in xrange(revrange[0], revrange[1] + 1,
+                                    updater.chunk_size)]
+        self.env.log.debug("Synchronize for revision range='%s' in %d "
+                           "chunks, %d jobs", str(revrange), len(chunks), jobs)
+
+        # REMARK: each worker opens its own environment, hence its own
+        #         repository and database connections
+        pool = multiprocessing.Pool(jobs, _init_worker, (self.env.path, ))
+        clock = time.time()
+        try:
+            tags = {}
+            for changesets, chunk_tags in pool.imap(_classify_revrange,
+                                                    chunks):
+                clock = self._lap('classify', clock)
+                if changesets:
+                    self.count += updater._sync_chunk(
+                        [ChangesetEntry().set(*row) for row in changesets])
+
+                # Deleted tags are dropped, as done by Repository._dispatch
+                for rev, name, last, row in sorted(chunk_tags):
+                    if last and name in tags:
+                        del tags[name]
+                    elif row:
+                        tags[name] = row
+                clock = self._lap('write', clock)
+            pool.close()
+        except:
+            pool.terminate()
+            self.env.log.error('revtree update error %s' %
+                               traceback.format_exc())
+            raise
+        finally:
+            pool.join()
+
+        updater._sync_tags(tags.values())
+        self._lap('tags', clock)
+
+
 class DBUpdater(DBMixing):
     plugin_name = 'revtree'
 
@@ -121,122 +491,256 @@ class DBUpdater(DBMixing):
         super(DBUpdater, self).__init__()
         self.env = env
         self.bcre = bcre
-        self.repos = Repository(env)
-
-    def sync(self, revrange=None):
+        self.chunk_size = DBComponent(env).sync_chunk_size
+        self.revision_properties = DBComponent(env).sync_revision_properties
+        # Last synchronization session
+        self.session = None
+        # Last retry time of the failed ranges, by process_sync_queue
+        self._gaps_retry = 0
+
+    def sync(self, revrange=None, jobs=1):
+        self.session = session = SyncSession(self)
         if not revrange:
-            return self._sync_revrange(revrange=None)
-
-        # Get RevTree table revisions
+            if jobs > 1:
+                revmax = session.repos.get_youngest_rev()
+                session.sync_parallel((session.repos.get_oldest_rev(),
+                                       revmax), jobs)
+            else:
+                try:
+                    session.sync_range(None)
+                except:
+                    self.env.log.error('revtree update error %s' %
+                                       traceback.format_exc())
+                    raise
+                revmax = session.repos.revision_range()[1]
+            self.set_sync_state(revmax, [])
+            self.bump_sync_generation()
+            self.env.log.info("Synchronized %s", session.summary())
+            return session.count
+
+        revrange = (int(revrange[0]), int(revrange[1]))
+
+        # Only revisions above the high-water mark and the known gaps are
+        # processed
+        hwm, gaps = self.get_sync_state()
+        if hwm is None:
+            hwm, gaps = self._scan_sync_state()
+        if hwm is None:
+            hwm = revrange[0] - 1
+
+        # REMARK: the known gaps are synchronized apart from the new range,
+        #         so that a revision failing on each sync does not prevent
+        #         the synchronization of the later revisions
+        ranges = _merge_ranges(gaps)
+        if revrange[1] > hwm:
+            revrange = (min(revrange[0], hwm + 1), revrange[1])
+        if revrange not in ranges:
+            ranges.append(revrange)
+
+        gaps = []
+        for rng in ranges:
+            failed = self._sync_bisect(session, rng)
+            session.failed.extend(failed)
+            gaps.extend(failed)
+
+        self.set_sync_state(max(hwm, revrange[1]), _merge_ranges(gaps))
+        self.bump_sync_generation()
+        self.env.log.info("Synchronized %s", session.summary())
+        return session.count
+
+    def _sync_bisect(self, session, revrange):
+        """Synchronizes a revision range, which is split in halves on
+           failure until the failing revisions are isolated. Returns the
+           ranges of the revisions which failed to synchronize.
+        """
+        try:
+            session.sync_range(revrange)
+        except EmptyRangeError:
+            self.env.log.debug("No changeset for revision range='%s'",
+                               str(revrange))
+        except Exception:
+            first, last = revrange
+            if first == last:
+                # REMARK: revision retried on next sync
+                self.env.log.error("Revision='%d' not synchronized, recorded "
+                                   "as sync gap: %s", first,
+                                   traceback.format_exc())
+                return [revrange]
+            self.env.log.warn("Revision range='%s' not synchronized, "
+                              "bisected", str(revrange))
+            middle = (first + last) // 2
+            return self._sync_bisect(session, (first, middle)) + \
+                self._sync_bisect(session, (middle + 1, last))
+        return []
+
+    def process_sync_queue(self, batch_size, retry_delay, max_attempts=0):
+        """Synchronizes a batch of the revisions queued by the post-commit
+           hook. Returns the number of synchronized queue entries.
+
+           The revisions of the batch are coalesced into one sync. The
+           entries whose revision is in a failed range of the sync are kept
+           in the queue and retried after a delay, doubled on each failure,
+           at most max_attempts times if not 0. When the queue is empty,
+           the sync gaps left by previous syncs are retried every
+           retry_delay seconds.
+        """
+        rows = self.get_sync_queue(batch_size)
+        if not rows:
+            gaps = self.get_sync_state()[1]
+            if gaps and time.time() - self._gaps_retry >= retry_delay:
+                self._gaps_retry = time.time()
+                # REMARK: sync processes all the known gaps along with the
+                #         given range, the first gap being one of them
+                try:
+                    self.sync(revrange=gaps[0])
+                except Exception:
+                    self.env.log.error('revtree queue error %s' %
+                                       traceback.format_exc())
+            return 0
+
+        revisions = [int(row[1]) for row in rows]
+        try:
+            self.sync(revrange=(min(revisions), max(revisions)))
+        except Exception:
+            self.env.log.error('revtree queue error %s' %
+                               traceback.format_exc())
+            self._defer_sync(rows, retry_delay, max_attempts)
+            return 0
+
+        failed = self.session.failed
+        deferred = [row for row in rows
+                    if any(first <= int(row[1]) <= last
+                           for first, last in failed)]
+        if deferred:
+            self.env.log.warn("Queued revisions='%s' deferred, failed "
+                              "ranges='%s'",
+                              ', '.join(str(row[1]) for row in deferred),
+                              str(failed))
+            self._defer_sync(deferred, retry_delay, max_attempts)
+
+        synced = [row[0] for row in rows if row not in deferred]
+        if synced:
+            self.dequeue_sync(synced)
+        return len(synced)
+
+    def _defer_sync(self, rows, retry_delay, max_attempts):
+        """Postpones the synchronization of the queued rows, the rows which
+           reached max_attempts being removed from the queue"""
+        dropped = [row for row in rows
+                   if max_attempts and row[2] + 1 >= max_attempts]
+        if dropped:
+            # REMARK: the revisions are still synchronized along with the
+            #         sync gaps, or the next range above the high-water mark
+            self.env.log.error("Queued revisions='%s' removed from the "
+                               "queue after %d attempts",
+                               ', '.join(str(row[1]) for row in dropped),
+                               max_attempts)
+            self.dequeue_sync([row[0] for row in dropped])
+        rows = [row for row in rows if row not in dropped]
+        if rows:
+            self.defer_sync(rows, retry_delay)
+
+    def _scan_sync_state(self):
+        """Computes the synchronization state from the revtree tables
+           contents, used when no state has been recorded yet.
+        """
         rows = self.env.db_query("SELECT revision FROM revtree_revisions")
-        revisions = [int(rev) for rev, in rows]
+        revisions = set(int(rev) for rev, in rows)
 
         # REMARK: tag revision not in revtree_revisions table so add them
         rows = self.env.db_query("SELECT tag_revision FROM revtree_tags")
-        for rev, in rows:
-            revisions.append(int(rev))
-        revisions.sort(reverse=False)
-
-        revisions_range = set()
-        if revisions:
-            # Theorical revision range
-            for rev in xrange(revisions[0], revisions[-1]):
-                revisions_range.add(rev)
-
-        # Use set for better performance
-        revisions = set(revisions)
-        missing_revisions = list(revisions_range.difference(revisions))
-        missing_revisions.sort(reverse=False)
-
-        revrange = list(revrange)
-
-        missing_revisions.append(revrange[1])
-
-        # Synchronize with missing revisions
-        if missing_revisions and missing_revisions[0] < revrange[0]:
-            revrange[0] = missing_revisions[0]
-
-        for rev in missing_revisions:
-            self._sync_revrange((rev, rev))
-
-    def _sync_revrange(self, revrange):
-        # Build informations from repository
-        self.repos = Repository(self.env)
-        self.repos.build(self.bcre, revrange=revrange)
-
-        self.env.log.debug("Synchronize for revision range='%s'" % \
-                            str(revrange))
-
-        try:
-            # Build tags table
-            tags = self.repos.tags()
-            for tag in tags.values():
-                # Verify tag do not exist
-                rows = self.env.db_query("SELECT * FROM revtree_tags "
-                                         "WHERE name=%s", (tag.name,))
-                if rows:
-                    self.env.log.debug("Tag name='%s' already exist", tag.name)
-                    continue
-
-                with self.env.db_transaction as db:
-                    args = (to_unicode(tag.name),
-                            to_unicode(tag.prettyname),
-                            tag.rev,
-                            to_unicode(tag.clone[1]),
-                            tag.clone[0])
-                    db("""INSERT INTO revtree_tags (name, prettyname, tag_revision, branch, revision)
-                          VALUES(%s, %s, %s, %s, %s)""", args)
-
-            # Build revisions table
-            for rev, vc in self.repos.changesets().iteritems():
-                if not vc.branchname:
-                    continue
-
-                # Verify revision do not exist
-                rows = self.env.db_query("SELECT * FROM revtree_revisions "
-                                         "WHERE revision=%s", (rev,))
-                if rows:
-                    self.env.log.debug("Revision='%s' already exist", rev)
-                    continue
-
-                branch_name = to_unicode(vc.branchname)
-                pretty_name = to_unicode(vc.prettyname)
-                author = to_unicode(vc.changeset.author)
-
-                with self.env.db_transaction as db:
-                    self.env.log.debug("Insert revision='%s'", rev)
-
-                    # Brings information
-                    bring = vc.prop('rth:bring')
-                    if bring:
-                        args = (branch_name, rev, bring)
+        revisions.update(int(rev) for rev, in rows)
+        if not revisions:
+            return None, []
+
+        missing = [rev for rev in xrange(min(revisions), max(revisions))
+                   if rev not in revisions]
+        return max(revisions), _merge_ranges((rev, rev) for rev in missing)
+
+    def _sync_tags(self, tags):
+        """Inserts the tags rows which are not yet recorded, in one
+           transaction"""
+        if not tags:
+            return
 
-                        db("INSERT INTO revtree_brings (branch, revision," \
-                           " bring) VALUES(%s, %s, %s)", args)
+        names = set(name for name, in
+                    self.env.db_query("SELECT name FROM revtree_tags"))
 
-                    # Delivers information
-                    deliver = vc.prop('rth:deliver')
-                    if deliver:
-                        args = (branch_name, rev, deliver)
-                        db("""INSERT INTO revtree_delivers (branch, revision, deliver)
-                           VALUES(%s, %s, %s)""", args)
+        rows = []
+        for row in tags:
+            if row[0] in names:
+                self.env.log.debug("Tag name='%s' already exist", row[0])
+                continue
+            names.add(row[0])
+            rows.append(row)
 
-                    # Revision information
-                    args = (int(rev),
-                            branch_name,
-                            pretty_name,
-                            author,
-                            to_timestamp(vc.date),
-                            str(vc.last),
-                            str(vc.clone))
-                    db("""INSERT INTO revtree_revisions (revision, branch, branch_name, author, date, last, clone)
-                       VALUES(%s, %s, %s, %s, %s, %s, %s)""", args)
+        if rows:
+            with self.env.db_transaction as db:
+                cursor = db.cursor()
+                cursor.executemany("""INSERT INTO revtree_tags (name, prettyname, tag_revision, branch, revision)
+                                      VALUES(%s, %s, %s, %s, %s)""", rows)
+
+    def _sync_chunk(self, chunk):
+        """Inserts a chunk of ChangesetEntry, sorted by revision, in a single
+           transaction. Returns the number of inserted revisions.
+        """
+        # Existence check of the whole chunk at once
+        rows = self.env.db_query("SELECT revision FROM revtree_revisions "
+                                 "WHERE revision>=%s AND revision<=%s",
+                                 (chunk[0].rev, chunk[-1].rev))
+        existing = set(int(rev) for rev, in rows)
+
+        brings = []
+        delivers = []
+        revisions = []
+        changesets = []
+        for vc in chunk:
+            rev = vc.rev
+            if rev in existing:
+                self.env.log.debug("Revision='%s' already exist", rev)
+                continue
+
+            # Brings information
+            if vc.bring:
+                brings.append((vc.branchname, rev, vc.bring))
+
+            # Delivers information
+            if vc.deliver:
+                delivers.append((vc.branchname, rev, vc.deliver))
+
+            # Revision information
+            revisions.append((rev,
+                              vc.branchname,
+                              vc.prettyname,
+                              vc.author,
+                              vc.date,
+                              str(vc.last),
+                              str(vc.clone),
+                              0))
+            changesets.append(vc)
+
+        if not changesets:
+            return 0
 
-                    self.update_branch(vc, db)
-        except:
-            self.env.log.error('revtree update error %s' %
-                               traceback.format_exc())
-            raise
+        with self.env.db_transaction as db:
+            self.env.log.debug("Insert revisions='%s-%s'",
+                               changesets[0].rev, changesets[-1].rev)
+            cursor = db.cursor()
+            if brings:
+                cursor.executemany("INSERT INTO revtree_brings (branch, "
+                                   "revision, bring) VALUES(%s, %s, %s)",
+                                   brings)
+            if delivers:
+                cursor.executemany("INSERT INTO revtree_delivers (branch, "
+                                   "revision, deliver) VALUES(%s, %s, %s)",
+                                   delivers)
+            cursor.executemany("""INSERT INTO revtree_revisions (revision, branch, branch_name, author, date, last, clone, deleted)
+                                  VALUES(%s, %s, %s, %s, %s, %s, %s, %s)""",
+                               revisions)
+
+            self.update_branches(changesets, cursor)
+
+        return len(changesets)
 
     def resync_rev(self, rev):
         # Build informations from repository
@@ -318,47 +822,81 @@ class DBUpdater(DBMixing):
                        "last=%%s, clone=%%s " \
                        "WHERE (branch='%s' AND revision=%s)" % \
                        (branch_name, rev), args)
+
+            self.bump_sync_generation(rewrite=True)
         except:
             self.env.log.error('revtree update error %s' %
                                traceback.format_exc())
             raise
 
-    def update_branch(self, vc, db):
-        brc = BranchEntry()
-
-        brc_name = to_unicode(vc.branchname)
-        pretty_name = to_unicode(vc.prettyname)
-
-        row = self.env.db_query("SELECT * from revtree_branches WHERE (branch=%s" \
-                                "AND terminalrev IS NULL)", (brc_name,))
-        if not row:
-            brc.branch = brc_name
-            brc.name = pretty_name
-
-            brc.firstrev = vc.rev
-            brc.date = to_timestamp(vc.date)
-            sql = "INSERT INTO revtree_branches VALUES (%s)" % brc.sql_fmt()
-        else:
-            brc.set(*row[0])
+    def update_branches(self, changesets, cursor):
+        """Applies ChangesetEntry, sorted by revision, to the branches
+           table. Each branch row is read and written back once per call.
+        """
+        names = list(set(vc.branchname for vc in changesets))
+
+        # Branches not terminated yet, by name
+        opened = {}
+        cursor.execute("SELECT * FROM revtree_branches "
+                       "WHERE terminalrev IS NULL AND branch IN (%s)" %
+                       ', '.join(['%s'] * len(names)), names)
+        for row in cursor.fetchall():
+            brc = BranchEntry().set(*row)
+            opened[brc.branch] = brc
+
+        updated = opened.values()
+        inserted = []
+        terminated = []
+        revisions = []
+        for vc in changesets:
+            brc_name = vc.branchname
+
+            brc = opened.get(brc_name)
+            if brc is None:
+                brc = BranchEntry()
+                brc.branch = brc_name
+                brc.name = vc.prettyname
+                brc.firstrev = vc.rev
+                brc.date = vc.date
+                opened[brc_name] = brc
+                inserted.append(brc)
+
+            # Update fields
+            brc.lastrev = vc.rev
+            revisions.append((int(brc.firstrev), int(vc.rev)))
+
+            if vc.last:
+                brc.terminalrev = vc.rev
+                terminated.append((int(brc.firstrev), ))
+                del opened[brc_name]
+
+            if vc.clone:
+                brc.srcrev = int(vc.clone[0])
+                brc.srcpath = vc.clone[1]
+
+        cursor.executemany("INSERT INTO revtree_branch_revisions "
+                           "(firstrev, revision) VALUES (%s, %s)", revisions)
+
+        # Flag the revisions of deleted branches
+        if terminated:
+            cursor.executemany("UPDATE revtree_revisions SET deleted=1 "
+                               "WHERE revision IN (SELECT revision "
+                               "FROM revtree_branch_revisions "
+                               "WHERE firstrev=%s)", terminated)
+
+        # REMARK: update existing rows first, as inserted rows may also match
+        # the open branch condition
+        if updated:
             # REMARK: %%s mandatory to get %s in final string
-            fmt = ', '.join('%s = %%s' % n for n in brc._field_names)
-            sql = "UPDATE revtree_branches SET %s WHERE (branch='%s' AND " \
-                  " (terminalrev IS NULL))" % (fmt, brc_name)
-
-        # Update fields
-        brc.lastrev = vc.rev
-        brc.revisions = ','.join([brc.revisions, str(vc.rev)]) \
-                        if brc.revisions else '%s' % str(vc.rev)
-
-        if vc.last:
-            brc.terminalrev = vc.rev
-
-        if vc.clone:
-            brc.srcrev = int(vc.clone[0])
-            brc.srcpath = vc.clone[1]
-
-        args = tuple(brc.sql_data())
-        db(sql, args)
+            fmt = ', '.join('%s = %%s' % n for n in BranchEntry._field_names)
+            cursor.executemany("UPDATE revtree_branches SET %s "
+                               "WHERE (branch=%%s AND terminalrev IS NULL)" %
+                               fmt, [entry.sql_data() + [entry.branch]
+                                     for entry in updated])
+        if inserted:
+            cursor.executemany("INSERT INTO revtree_branches VALUES (%s)" %
+                               BranchEntry().sql_fmt(),
+                               [entry.sql_data() for entry in inserted])
 
 
 class DBComponent(Component, DBMixing):
@@ -368,6 +906,43 @@ class DBComponent(Component, DBMixing):
 
     plugin_name = 'revtree'
 
+    sync_chunk_size = IntOption('revtree', 'sync_chunk_size', '1000',
+        doc="""Number of revisions written per database transaction when
+        synchronizing revtree tables""")
+
+    sync_revision_properties = BoolOption('revtree',
+                                          'sync_revision_properties', 'true',
+        doc="""Read the `rth:bring` and `rth:deliver` revision properties
+        when synchronizing revtree tables. Properties are read from
+        Subversion, one call per branch revision, as the Trac repository
+        cache does not hold them: disable when the repository does not use
+        them""")
+
+    sync_queue = BoolOption('revtree', 'sync_queue', 'false',
+        doc="""Queue the committed revisions in the post-commit hook, rather
+        than synchronizing revtree tables in the hook. Queued revisions are
+        synchronized by the `trac-admin revtree worker` command""")
+
+    sync_queue_batch_size = IntOption('revtree', 'sync_queue_batch_size',
+                                      '500',
+        doc="""Maximum number of queued revisions synchronized at once by
+        the revtree worker""")
+
+    sync_queue_poll_interval = IntOption('revtree',
+                                         'sync_queue_poll_interval', '5',
+        doc="""Seconds between two polls of an empty sync queue by the
+        revtree worker""")
+
+    sync_retry_delay = IntOption('revtree', 'sync_retry_delay', '60',
+        doc="""Seconds before the first retry of a failed synchronization
+        by the revtree worker, doubled on each new failure""")
+
+    sync_queue_max_attempts = IntOption('revtree', 'sync_queue_max_attempts',
+                                        '10',
+        doc="""Number of failed synchronizations after which a queued
+        revision is removed from the sync queue, 0 for no limit. Removed
+        revisions are retried along with the sync gaps""")
+
     # IEnvironmentSetupParticipant methods
 
     def environment_created(self):
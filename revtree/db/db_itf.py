@@ -38,38 +38,127 @@ class DBInterface(object):
                                   "revtree_branches" % prop)]
 
     def get_branch(self, name, rev=None):
+        if rev:
+            rows = self.env.db_query("SELECT b.* FROM revtree_branches b "
+                                     "INNER JOIN revtree_branch_revisions r "
+                                     "ON r.firstrev=b.firstrev "
+                                     "WHERE b.branch=%s AND r.revision=%s",
+                                     (name, rev))
+            if rows:
+                return [BranchEntry(self).set(*rows[0]), ]
+
         rows = self.env.db_query("SELECT * FROM revtree_branches " \
                                  "WHERE branch='%s'" % name)
 
         branches = []
         for row in rows:
-            brc = BranchEntry()
+            brc = BranchEntry(self)
             brc.set(*row)
-            if rev and rev in brc.get_revisions():
-                return [brc, ]
             branches.append(brc)
         return branches
 
+    def get_branch_revisions(self, firstrev, revrange=None):
+        """Returns the revisions of the branch started at firstrev, in
+        reversed order"""
+        sql = "SELECT revision FROM revtree_branch_revisions " \
+              "WHERE firstrev=%s"
+        args = [firstrev]
+        if revrange:
+            sql += " AND revision>=%s AND revision<=%s"
+            args.extend(revrange)
+        rows = self.env.db_query(sql + " ORDER BY revision DESC", args)
+        return [rev for rev, in rows]
+
+    def get_revision_firstrev(self, rev):
+        """Returns the first revision of the branch owning rev, None if
+        unknown"""
+        rows = self.env.db_query("SELECT firstrev FROM "
+                                 "revtree_branch_revisions "
+                                 "WHERE revision=%s", (rev, ))
+        return rows[0][0] if rows else None
+
     def get_authors(self):
         return [a for a, in
                 self.env.db_query("SELECT DISTINCT author FROM " \
                                   "revtree_revisions")]
 
-    def get_revisions(self):
+    def _revisions_where(self, revrange=None, daterange=None, authors=None,
+                         branches=None):
+        """Builds the revtree_revisions WHERE conditions and arguments of the
+        restrictions, None if no revision can match"""
+        where = []
+        args = []
+        if revrange:
+            where.append("revision>=%s AND revision<=%s")
+            args.extend(revrange)
+        if daterange:
+            where.append("date>=%s AND date<=%s")
+            args.extend(daterange)
+        for column, values in (('author', authors), ('branch', branches)):
+            if values is None:
+                continue
+            if not values:
+                return None
+            where.append("%s IN (%s)" % (column,
+                                         ', '.join(['%s'] * len(values))))
+            args.extend(values)
+        return where, args
+
+    def get_revisions(self, revrange=None, daterange=None, authors=None,
+                      branches=None):
+        """Yields revision entries in reversed order, restricted to the
+        (first, last) revrange, the (start, stop) daterange timestamps and
+        the authors and branches name sequences if any"""
+        restrictions = self._revisions_where(revrange, daterange,
+                                             authors, branches)
+        if restrictions is None:
+            return
+        where, args = restrictions
+
+        sql = "SELECT * FROM revtree_revisions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+
         with self.env.db_query as db:
             cursor = db.cursor()
-            cursor.execute("SELECT * FROM revtree_revisions " \
-                           "ORDER BY revision DESC")
+            cursor.execute(sql + " ORDER BY revision DESC", args)
             row = cursor.fetchone()
             while(row):
                 yield RevisionEntry().set(*row)
                 row = cursor.fetchone()
 
+    def get_clause_revisions(self, clauses, **kwargs):
+        """Yields (revision, branch, clause) tuples in reversed order, for
+        the revisions matching at least one of the clauses predicates.
+        Clauses are (sql, args) tuples, clause is the index of the first
+        matching clause, starting at 1. Keyword arguments are the
+        restrictions of `get_revisions`."""
+        restrictions = self._revisions_where(**kwargs)
+        if restrictions is None or not clauses:
+            return
+        where, args = restrictions
+
+        case = ' '.join("WHEN (%s) THEN %d" % (sql, idx + 1)
+                        for idx, (sql, _) in enumerate(clauses))
+        case_args = [arg for _, clause_args in clauses for arg in clause_args]
+
+        where.append(' OR '.join('(%s)' % sql for sql, _ in clauses))
+
+        sql = "SELECT revision, branch, CASE %s END FROM revtree_revisions " \
+              "WHERE %s ORDER BY revision DESC" % \
+              (case, " AND ".join('(%s)' % w for w in where))
+
+        with self.env.db_query as db:
+            cursor = db.cursor()
+            cursor.execute(sql, case_args + args + case_args)
+            for row in cursor:
+                yield row
+
     def get_branches(self):
         rows = self.env.db_query("SELECT * FROM revtree_branches")
         for row in rows:
             # Branch entry
-            brc = BranchEntry()
+            brc = BranchEntry(self)
             brc.set(*row)
             yield brc
 
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from revtree.db.db import DBComponent
+from trac.core import Component
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _view(column):
+    """Returns a NumPy array sharing the memory of an array column"""
+    return numpy.frombuffer(column, dtype=numpy.dtype(column.typecode))
+
+
+class RevisionIndex(Component):
+    """Columnar in-memory index of the revtree_revisions table.
+
+    Revision, date, author and branch columns are held as parallel arrays
+    sorted by revision, built once per process and refreshed incrementally
+    with newly synchronized revisions. Query filter clauses are evaluated
+    as NumPy mask operations over these columns.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        if numpy is None:
+            self.log.warning('NumPy is not available, the in-memory '
+                             'revision index is disabled')
+
+    def _reset(self):
+        # Synchronization generation of the indexed rows
+        self._generation = None
+
+        # Columns
+        self._revisions = array('i')
+        self._dates = array('l')
+        self._author_ids = array('i')
+        self._branch_ids = array('i')
+        self._deleted = array('b')
+
+        # Authors and branches names, by id and by name
+        self._authors = []
+        self._author_map = {}
+        self._branches = []
+        self._branch_map = {}
+
+    def _intern(self, names, ids, name):
+        idx = ids.get(name)
+        if idx is None:
+            idx = ids[name] = len(names)
+            names.append(name)
+        return idx
+
+    def _refresh(self):
+        """Appends the revisions synchronized since the last refresh, the
+           index is rebuilt if synchronized revisions have been updated or
+           if revisions older than the youngest indexed one have been
+           synchronized"""
+        db_component = DBComponent(self.env)
+        generation = db_component.get_sync_generation()
+        if generation == self._generation:
+            return
+        if self._generation is not None and \
+                db_component.get_rewrite_generation() > self._generation:
+            self.log.debug('Rebuilding revision index')
+            self._reset()
+        self._generation = generation
+
+        count, = self.env.db_query("SELECT COUNT(*) "
+                                   "FROM revtree_revisions")[0]
+        if count == len(self._revisions):
+            return
+
+        youngest = self._revisions[-1] if self._revisions else -1
+        rows = self.env.db_query("SELECT revision, date, author, branch, "
+                                 "last FROM revtree_revisions "
+                                 "WHERE revision>%s ORDER BY revision",
+                                 (youngest,))
+        reset = not self._revisions
+        if len(self._revisions) + len(rows) != count:
+            self.log.debug('Rebuilding revision index')
+            self._reset()
+            self._generation = generation
+            reset = True
+            rows = self.env.db_query("SELECT revision, date, author, "
+                                     "branch, last FROM revtree_revisions "
+                                     "ORDER BY revision")
+
+        terminated = False
+        for rev, date, author, branch, last in rows:
+            self._revisions.append(int(rev))
+            self._dates.append(int(date))
+            self._author_ids.append(self._intern(self._authors,
+                                                 self._author_map, author))
+            self._branch_ids.append(self._intern(self._branches,
+                                                 self._branch_map, branch))
+            terminated = terminated or last == 'True'
+
+        # REMARK: a terminated branch changes the state of its older
+        # revisions
+        if reset or terminated:
+            rows = self.env.db_query("SELECT deleted FROM revtree_revisions "
+                                     "ORDER BY revision")
+            self._deleted = array('b', [int(d or 0) for d, in rows])
+        else:
+            self._deleted.extend([0] * len(rows))
+
+    def _clause_mask(self, constants, columns):
+        """Returns the mask of the revisions matching a clause, None if a
+           constraint is not supported"""
+        revisions, dates, author_ids, branch_ids, deleted = columns
+
+        def ranges(column, value):
+            rule = numpy.zeros(len(revisions), dtype=bool)
+            for first, last in value:
+                rule |= (column >= first) & (column <= last)
+            return rule
+
+        mask = numpy.ones(len(revisions), dtype=bool)
+        for name, value in constants.iteritems():
+            if value is None:
+                continue
+            if name == 'author':
+                ids = [self._author_map[a] for a in value
+                       if a in self._author_map]
+                mask &= numpy.isin(author_ids, ids)
+            elif name == 'branch':
+                ids = [self._branch_map[b] for b in value
+                       if b in self._branch_map]
+                mask &= numpy.isin(branch_ids, ids)
+            elif name == 'revision':
+                # REMARK: revisions are sorted
+                rule = numpy.zeros(len(revisions), dtype=bool)
+                for first, last in value:
+                    rule[revisions.searchsorted(first, 'left'):
+                         revisions.searchsorted(last, 'right')] = True
+                mask &= rule
+            elif name in ('period', 'date'):
+                mask &= ranges(dates, value)
+            elif name == 'deleted_branches':
+                mask &= deleted == 0
+            else:
+                return None
+        return mask
+
+    def query(self, query):
+        """Returns the (revision, branch, clause) tuples, in reversed order,
+           of the revisions matching the query filter clauses; clause is the
+           index of the first matching clause, starting at 1. Returns None
+           when the index cannot evaluate the query.
+        """
+        if numpy is None:
+            return None
+
+        with self._lock:
+            self._refresh()
+            if not self._revisions:
+                return []
+
+            columns = [_view(c) for c in (self._revisions, self._dates,
+                                          self._author_ids, self._branch_ids,
+                                          self._deleted)]
+
+            clauses = numpy.zeros(len(self._revisions), dtype=numpy.int16)
+            for idx, constants in enumerate(query.constants()):
+                mask = self._clause_mask(constants, columns)
+                if mask is None:
+                    return None
+                clauses[mask & (clauses == 0)] = idx + 1
+
+            revisions, branch_ids = columns[0], columns[3]
+            return [(int(revisions[i]), self._branches[branch_ids[i]],
+                     int(clauses[i]))
+                    for i in numpy.nonzero(clauses)[0][::-1]]
@@ -3,7 +3,7 @@
 from trac.db import Table, Column, Index
 
 # Database version identifier. Used for automatic upgrades.
-db_version = 1
+db_version = 5
 
 schema = [
     Table('revtree_brings')[
@@ -31,7 +31,12 @@ schema = [
         Column('author'),
         Column('date', type='int64'),
         Column('last'),
-        Column('clone')],
+        Column('clone'),
+        Column('deleted', type='int'),  # revision of a deleted branch
+        Index(['revision']),
+        Index(['date']),
+        Index(['author']),
+        Index(['branch'])],
 
     Table('revtree_branches')[
         Column('branch'),
@@ -39,10 +44,24 @@ schema = [
         Column('date', type='int64'),
         Column('firstrev', type='int'),
         Column('lastrev', type='int'),
-        Column('revisions'), # comma-separated revisions
         Column('srcpath'),
         Column('srcrev', type='int'),
         Column('terminalrev', type='int'),
         Index(['branch'])
         ],
+
+    # Branch revisions, a branch is identified by its first revision
+    Table('revtree_branch_revisions', key=('firstrev', 'revision'))[
+        Column('firstrev', type='int'),
+        Column('revision', type='int'),
+        Index(['revision'])],
+
+    # Revisions queued by the post-commit hook, to be synchronized by the
+    # revtree worker
+    Table('revtree_sync_queue', key='id')[
+        Column('id', auto_increment=True),
+        Column('revision', type='int'),
+        Column('time', type='int64'),
+        Column('attempts', type='int'),
+        Column('retry', type='int64')],  # no attempt before this time
 ]
@@ -41,6 +41,8 @@ require(['jquery', 'revtree'],
         var tools_top;
         var tools_margin_left;
         var xhr;
+        var last_etag = null;
+        var last_data = null;
 
         initializeFilters();
 
@@ -58,6 +60,10 @@ require(['jquery', 'revtree'],
           $(this).neosuggest('', 'autocompletion', null);
         });
 
+        $("input[name$='_revision']").each(function() {
+          $(this).neosuggest('', 'revcompletion', null);
+        });
+
         $(".datepicker").datepicker();
 
         window_ctrl = $(window);
@@ -99,9 +105,18 @@ require(['jquery', 'revtree'],
           RevTree.prototype.abort_action_selector(event);
         });
 
-        var ajax_success = function(data) {
+        var ajax_success = function(data, status, jqxhr) {
            var tree;
 
+           /* Revision tree not modified since the previous request */
+           if (jqxhr.status == 304) {
+             data = last_data;
+           }
+           else {
+             last_etag = jqxhr.getResponseHeader('ETag');
+             last_data = data;
+           }
+
            $("#main :input").attr("disabled", "disabled");
 
            tree = new RevTree(data.tree, data.url, data.style);
@@ -127,14 +142,8 @@ require(['jquery', 'revtree'],
            $("#svgview").css("display", "none");
            $("#svgview").css("display", "block");
 
-           $("select[name$='_revision']").each(function() {
-             var value = $(this).val();
-             $(this).empty();
-             $(this).addOptions(data.revisions);
-
-             window.revisions = data.revisions;
-             $(this).val(value);
-           });
+           /* Revisions range descriptor */
+           window.revisions = data.revisions;
 
            $("select[name$='_author']").each(function() {
              var value = $(this).val();
@@ -213,7 +222,8 @@ require(['jquery', 'revtree'],
              type: "POST",
              async: true,
              dataType: 'json', /* Server response data format */
-             data: $("#query_form").serialize(),
+             data: $("#query_form").serialize() + "&tree_format=columns",
+             headers: last_etag ? {'If-None-Match': last_etag} : {},
              success: ajax_success,
              error: ajax_error
            });
@@ -374,6 +374,8 @@ define(['jquery', 'revtree_branch'],
             this.scale = 1;
 
             this.max_rev = tree.max_rev.toString()
+            this.format = tree.format;
+            this.version = tree.version;
 
             this._changesets = new Array();
             this._revisions = [];
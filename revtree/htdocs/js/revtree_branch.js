@@ -11,6 +11,73 @@ define(['jquery', 'revtree_changeset', 'revtree_color', 'revtree_branchheader',
              RevTreeBranchHeader, revtreeutils) {
       var UNIT = 25.;
 
+      /**: decode_columns(branch)
+       Decode changesets of branch exported as columns: delta encoded
+       revisions, run-length encoded clauses and sparse maps indexed by
+       changeset position.
+
+       :param branch: branch information in columns format
+       :returns: changesets information list
+       */
+      function decode_columns(branch)
+      {
+        var revisions = new Array(branch.revs.length);
+        var idx, rev, run, count, revision;
+
+        for(idx=0, rev=0; idx < branch.revs.length; idx++) {
+          rev = (idx == 0) ? branch.revs[0] : rev - branch.revs[idx];
+          revisions[idx] = {rev: rev};
+        }
+
+        for(run=0, idx=0; run < branch.clauses.length; run++) {
+          for(count=branch.clauses[run][0]; count > 0; count--, idx++) {
+            if(branch.clauses[run][1] !== null) {
+              revisions[idx].clause = branch.clauses[run][1];
+            }
+          }
+        }
+
+        for(idx=0; idx < branch.first.length; idx++) {
+          revisions[branch.first[idx]].firstrev = true;
+        }
+        for(idx=0; idx < branch.last.length; idx++) {
+          revisions[branch.last[idx]].lastrev = true;
+        }
+
+        $.each(['src', 'brings', 'delivers', 'tags'], function(i, name) {
+          $.each(branch[name], function(pos, value) {
+            revisions[pos][name] = value;
+          });
+        });
+
+        return revisions;
+      }
+
+      /* Branch decoders, by export format and version */
+      var DECODERS = {
+        changesets: {1: function(branch) { return branch.revisions; }},
+        columns: {1: decode_columns}
+      };
+
+      /**: decode_branch(branch, format, version)
+       Decode changesets of branch exported in format version.
+
+       :param branch: branch information
+       :param format: export format, 'changesets' or 'columns'
+       :param version: export format version
+       :returns: changesets information list
+       */
+      function decode_branch(branch, format, version)
+      {
+        var decoders = DECODERS[format] || {};
+
+        if(!(version in decoders)) {
+          throw new Error("Unsupported revision tree format " + format +
+                          " version " + version);
+        }
+        return decoders[version](branch);
+      }
+
       /**: RevTreeBranch(parent, branch, style)
        Object prototype to create revision tree branch.
 
@@ -25,7 +92,8 @@ define(['jquery', 'revtree_changeset', 'revtree_color', 'revtree_branchheader',
         this._parent = parent;
         this._name = branch.name;
         this._path = branch.path;
-        this._revisions = branch.revisions;
+        this._revisions = decode_branch(branch, parent.format,
+                                        parent.version);
         this._extent = [0, 0];
         this._first_chgset = null;
         this._lastrev = branch.lastrev;
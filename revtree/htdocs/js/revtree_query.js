@@ -72,6 +72,16 @@
     return e;
   }
 
+  // Create a revision <input>, with completion of the revision numbers
+  function createRevision(name, value, size) {
+    var e = $($.htmlFormat('<input type="text" name="$1" class="revision" \
+        size="$2" value="$3">', name, size, value));
+
+    e.neosuggest('', 'revcompletion', null);
+
+    return e;
+  }
+
   // Create a <EditDate>
   function createEditDate(name) {
     var e = $($.htmlFormat('<input type="text" name="$1" \
@@ -257,11 +267,12 @@
       else
       if (property == "revision") {
           var selector_min, selector_max;
+          var size = String(window.revisions.max).length;
 
-          selector_min = createSelect(propertyName, window.revisions);
-          selector_min.get(0).selectedIndex = window.revisions.length - 1;
-          selector_max = createSelect(propertyName, window.revisions);
-          selector_max.get(0).selectedIndex = 0;
+          selector_min = createRevision(propertyName, window.revisions.min,
+                                        size);
+          selector_max = createRevision(propertyName, window.revisions.max,
+                                        size);
 
           td.append(createLabel(_("From"))).append(" ")
           .append(selector_min).append(" ")
@@ -12,21 +12,50 @@
 # history and logs, available at http://projects.edgewall.com/trac/.
 #
 
+from bisect import insort
 from datetime import datetime
+from itertools import groupby
 from revtree import EmptyRangeError, BranchPathError
 from revtree.db.db_itf import DBInterface
 from trac.core import *
-from trac.util.datefmt import utc
+from trac.util.datefmt import utc, from_utimestamp
 from trac.util.text import to_unicode
 from trac.versioncontrol import NoSuchNode, Node as TracNode, \
     Changeset as TracChangeset
 from trac.versioncontrol.api import RepositoryManager
+from trac.versioncontrol.cache import CachedRepository
 import time
 
 
 __all__ = ['Repository']
 
 
+class CachedTracChangeset(TracChangeset):
+
+    """Trac changeset loaded from the Trac repository cache tables"""
+
+    # Cache tables node kinds and change types
+    kinds = {'D': TracNode.DIRECTORY, 'F': TracNode.FILE}
+    changes = {'A': TracChangeset.ADD, 'C': TracChangeset.COPY,
+               'D': TracChangeset.DELETE, 'E': TracChangeset.EDIT,
+               'M': TracChangeset.MOVE}
+
+    def __init__(self, repos, rev, message, author, date, changes):
+        TracChangeset.__init__(self, repos, rev, message, author, date)
+        self._changes = changes
+
+    def get_changes(self):
+        for path, kind, change, base_path, base_rev in self._changes:
+            yield (path, self.kinds.get(kind), self.changes.get(change),
+                   base_path, base_rev and int(base_rev))
+
+    def get_properties(self):
+        # REMARK: revision properties are not held by the cache tables, they
+        #         are read from the wrapped Subversion repository, without
+        #         the cache query of CachedRepository.get_changeset
+        return self.repos.repos.get_changeset(self.rev).get_properties()
+
+
 class Changeset(object):
 
     """Represents a Subversion revision with additionnal properties"""
@@ -80,7 +109,7 @@ class Changeset(object):
 
     def _load_properties(self):
         if not isinstance(self.properties, dict):
-            self.properties = self.repos.get_revision_properties(self.rev)
+            self.properties = self.changeset.get_properties()
 
     def prop(self, prop):
         self._load_properties()
@@ -276,8 +305,7 @@ class Branch(object):
 
     def add_changeset(self, changeset):
         """Adds a new changeset to the branch"""
-        self._changesets.append(changeset)
-        self._changesets.sort()
+        insort(self._changesets, changeset)
 
     def __len__(self):
         """Counts the number of tracked changesets"""
@@ -369,6 +397,9 @@ class Repository(object):
         # Dictionary of tags
         self._tags = {}
 
+        # Range of built revisions
+        self._revrange = None
+
         # Branch regular expression
         self.bcre = None
 
@@ -384,15 +415,38 @@ class Repository(object):
                     self._branches[br] = Branch(br, chgset.prettyname)
                 self._branches[br].add_changeset(chgset)
             elif isinstance(chgset, TagChangeset):
-                if chgset.name in self._tags:
-                    if chgset.last:
-                        self.log.info('Removing deleted tag %s' % chgset.name)
-                        del self._tags[chgset.name]
-                        continue
-                    self.log.warn('Ubiquitous tag: %s', chgset.name)
-                self._tags[chgset.name] = chgset
+                self._dispatch_tag(chgset)
         map(lambda b: b.build(self), self._branches.values())
 
+    def _dispatch_tag(self, chgset):
+        """Adds a tag changeset to the tag dictionary, or removes the tag
+           if the changeset deletes it"""
+        if chgset.name in self._tags:
+            if chgset.last:
+                self.log.info('Removing deleted tag %s' % chgset.name)
+                del self._tags[chgset.name]
+                return
+            self.log.warn('Ubiquitous tag: %s', chgset.name)
+        self._tags[chgset.name] = chgset
+
+    def _classify(self, bcre, vc):
+        """Returns the branch or tag changeset of a Trac changeset, None if
+           the changeset is neither a known branch or tag"""
+        info = Changeset.get_chgset_info(vc)
+        chgset = None
+        mo = info and bcre.match(info['path'])
+        if mo:
+            mo_dict = mo.groupdict()
+            if 'branch' in mo_dict and mo_dict['branch']:
+                chgset = BranchChangeset(self, vc)
+            if 'tag' in mo_dict and mo_dict['tag']:
+                chgset = TagChangeset(self, vc)
+        if chgset and chgset.build(bcre):
+            return chgset
+        self.log.warn('Changeset neither a known branch or tag: %s' %
+                      (info or vc))
+        return None
+
     def changeset(self, revision):
         """Returns a tracked changeset from the revision number"""
         if revision in self._changesets:
@@ -432,6 +486,11 @@ class Repository(object):
                 authors.append(author)
         return authors
 
+    def revision_range(self):
+        """Returns a tuple representing the extent of built revisions
+           (first, last)"""
+        return self._revrange
+
     def get_youngest_rev(self):
         return self._crepos.get_youngest_rev()
 
@@ -464,8 +523,11 @@ class Repository(object):
     def get_authors(self):
         return self._db_itf.get_authors()
 
-    def get_revisions(self):
-        return self._db_itf.get_revisions()
+    def get_revisions(self, **kwargs):
+        return self._db_itf.get_revisions(**kwargs)
+
+    def get_clause_revisions(self, clauses, **kwargs):
+        return self._db_itf.get_clause_revisions(clauses, **kwargs)
 
     def get_branches(self):
         return self._db_itf.get_branches()
@@ -488,6 +550,9 @@ class Repository(object):
     def get_branch(self, name, rev=None):
         return self._db_itf.get_branch(name, rev=rev)
 
+    def get_revision_firstrev(self, rev):
+        return self._db_itf.get_revision_firstrev(rev)
+
     def build(self,
               bcre,
               revrange=None,
@@ -497,18 +562,8 @@ class Repository(object):
         self.bcre = bcre
 
         if revrange:
-            revmin = self._crepos.get_oldest_rev()
-            revmax = self._crepos.get_youngest_rev()
-            if revrange[0]:
-                revmin = revrange[0]
-            if revrange[1]:
-                revmax = min(revrange[1], revmax)
-
-            vcchangesets = []
-            rev = revmax
-            while revmin <= rev:
-                vcchangesets.append(self.get_changeset(rev))
-                rev = self._crepos.previous_rev(rev)
+            revmin, revmax = self._get_build_range(revrange)
+            vcchangesets = list(self._get_cached_changesets(revmin, revmax))
         else:
             start = 0
             stop = int(time.time())
@@ -540,22 +595,89 @@ class Repository(object):
         self._revrange = (vcsort[0][1].rev, vcsort[-1][1].rev)
         vcsort.reverse()
         for (rev, vc) in vcsort:
-            info = Changeset.get_chgset_info(vc)
-            chgset = None
-            mo = info and bcre.match(info['path'])
-            if mo:
-                mo_dict = mo.groupdict()
-                if 'branch' in mo_dict and mo_dict['branch']:
-                    chgset = BranchChangeset(self, vc)
-                if 'tag' in mo_dict and mo_dict['tag']:
-                    chgset = TagChangeset(self, vc)
-            if chgset and chgset.build(bcre):
+            chgset = self._classify(bcre, vc)
+            if chgset:
                 self._changesets[rev] = chgset
-            else:
-                self.log.warn('Changeset neither a known branch or tag: %s' %
-                              (info or vc))
         self._dispatch()
 
+    def iter_changesets(self, bcre, revrange=None):
+        """Generates the branch and tag changesets of a revision range, the
+           whole repository if revrange is None, in revision order.
+
+           Unlike build, the changesets are neither kept nor dispatched to
+           branches, only the tag dictionary of the range is maintained:
+           memory use does not depend on the extent of the range.
+        """
+        self.bcre = bcre
+        revmin, revmax = self._get_build_range(revrange)
+
+        self._tags = {}
+        self._revrange = None
+        for vc in self._get_cached_changesets(revmin, revmax):
+            self._revrange = ((self._revrange or (vc.rev, ))[0], vc.rev)
+            chgset = self._classify(bcre, vc)
+            if isinstance(chgset, TagChangeset):
+                self._dispatch_tag(chgset)
+            if chgset:
+                yield chgset
+
+        if self._revrange is None:
+            raise EmptyRangeError
+
+    def _get_build_range(self, revrange):
+        """Returns the (first, last) revisions of revrange, bounded by the
+           repository revisions"""
+        revmin = self._crepos.get_oldest_rev()
+        revmax = self._crepos.get_youngest_rev()
+        if revrange and revrange[0]:
+            revmin = revrange[0]
+        if revrange and revrange[1]:
+            revmax = min(revrange[1], revmax)
+        return revmin, revmax
+
+    def _get_cached_changesets(self, revmin, revmax, window=1000):
+        """Generates the changesets of [revmin, revmax] in revision order,
+           read window by window from the Trac repository cache tables when
+           the repository is cached, from Subversion otherwise or for the
+           revisions missing in the cache.
+
+           Cached changesets still read from Subversion their revision
+           properties, when requested, and the copy history of the branch
+           creations, which the cache tables do not hold.
+        """
+        rev = revmin
+        if isinstance(self._crepos, CachedRepository):
+            crepos = self._crepos
+            for first in xrange(revmin, revmax + 1, window):
+                last = min(first + window - 1, revmax)
+                rows = self.env.db_query("""
+                    SELECT r.rev, r.time, r.author, r.message, n.path,
+                           n.node_type, n.change_type, n.base_path, n.base_rev
+                    FROM revision r
+                    LEFT OUTER JOIN node_change n
+                        ON n.repos=r.repos AND n.rev=r.rev
+                    WHERE r.repos=%s AND r.rev>=%s AND r.rev<=%s
+                    ORDER BY r.rev, n.path""",
+                    (crepos.id, crepos.db_rev(first), crepos.db_rev(last)))
+                for dbrev, items in groupby(rows, lambda row: row[0]):
+                    cached = crepos.rev_db(dbrev)
+                    # REMARK: Subversion revisions are contiguous, revisions
+                    #         between two cached ones are missing in the cache
+                    while rev < cached:
+                        yield self.get_changeset(rev)
+                        rev += 1
+                    items = list(items)
+                    _, time_, author, message = items[0][:4]
+                    changes = [item[4:] for item in items
+                               if item[4] is not None]
+                    yield CachedTracChangeset(crepos, cached, message or '',
+                                              author or '',
+                                              from_utimestamp(time_), changes)
+                    rev = cached + 1
+        while rev is not None and rev <= revmax:
+            yield self.get_changeset(rev)
+            rev = self._crepos.next_rev(rev)
+
     def build_rev(self, bcre, rev):
         """Builds an internal representation of the repository, which
            is used to generate a graphical view of it"""
@@ -571,20 +693,9 @@ class Repository(object):
         self._revrange = (vcsort[0][1].rev, vcsort[-1][1].rev)
         vcsort.reverse()
         for (rev, vc) in vcsort:
-            info = Changeset.get_chgset_info(vc)
-            chgset = None
-            mo = info and bcre.match(info['path'])
-            if mo:
-                mo_dict = mo.groupdict()
-                if 'branch' in mo_dict and mo_dict['branch']:
-                    chgset = BranchChangeset(self, vc)
-                if 'tag' in mo_dict and mo_dict['tag']:
-                    chgset = TagChangeset(self, vc)
-            if chgset and chgset.build(bcre):
+            chgset = self._classify(bcre, vc)
+            if chgset:
                 self._changesets[rev] = chgset
-            else:
-                self.log.warn('Changeset neither a known branch or tag: %s' %
-                              (info or vc))
         self._dispatch()
 
     def __str__(self):
@@ -4,7 +4,7 @@ port of http://trac.edgewall.org/browser/trunk/contrib/trac-post-commit-hook
 """
 
 from repository_hook_system.interface import IRepositoryHookSubscriber
-from revtree.db.db import DBUpdater
+from revtree.db.db import DBComponent, DBUpdater
 from trac.core import Component, implements
 from trac.config import Option
 import re
@@ -52,6 +52,15 @@ class PostCommit(Component):
         if changeset:
             revision = changeset.rev
 
+        # REMARK: with the sync queue, the revision is synchronized later by
+        #         the revtree worker, keeping the hook duration constant
+        db_component = DBComponent(self.env)
+        if db_component.sync_queue:
+            db_component.enqueue_sync(revision)
+            self.env.log.debug("Queue revtree sync of revision='%s'" %
+                               revision)
+            return
+
         self.env.log.debug("Resync revtree tables for")
         self._do_sync(revision)
 
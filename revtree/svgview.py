@@ -24,18 +24,21 @@ class SvgChangeset(object):
 
     """Changeset/revision node"""
 
+    __slots__ = ('_rev', '_firstrev', '_lastrev', '_srcrev', '_clause',
+                 '_brings', '_delivers', '_tags')
+
     def __init__(self, rev, clause=None):
         super(SvgChangeset, self).__init__()
 
-        self._classes = []
         self._rev = rev
         self._firstrev = False
         self._lastrev = False
         self._srcrev = None
         self._clause = clause
+        # REMARK: allocated on first use, few changesets have some
         self._brings = None
         self._delivers = None
-        self._tags = []
+        self._tags = None
 
     def mark_first(self):
         """Marks the changeset as the first of the branch.
@@ -56,6 +59,8 @@ class SvgChangeset(object):
         self._delivers = list(revs)
 
     def add_tag(self, tag):
+        if self._tags is None:
+            self._tags = []
         self._tags.append(tag.prettyname)
 
     def export(self):
@@ -93,7 +98,7 @@ class SvgBranch(object):
     """Branch (set of changesets which whose commits share a common base
        directory)"""
 
-    def __init__(self, parent, branch, style):
+    def __init__(self, parent, branch, style, revisions=None):
         self._parent = parent
         self._branch = branch
 
@@ -101,29 +106,21 @@ class SvgBranch(object):
         self._tags = []
         self._lastrev = True
 
-        # Branch revisions
-        brc_revisions = branch.get_revisions()
-
         # Branch revisions to display
-        revisions = filter(lambda r, mn=parent.revrange[0],
-                           mx=parent.revrange[1]:
-                           (mn <= r <= mx) and (r not in parent.filtered_revisions), brc_revisions)
-        revisions.sort(reverse=True)
+        if revisions is None:
+            revisions = [r for r in branch.get_revisions(parent.revrange)
+                         if r not in parent.filtered_revisions]
 
         # Display arrow under branch name to indicate that more recent
         # revisions exist but not displayed
-        if revisions[0] < brc_revisions[0]:
+        if revisions[0] < branch.lastrev:
             self._lastrev = False
 
-        def _get_clause(rev):
-            # Get clause if any
-            for r, c in parent.revisions:
-                if r == rev:
-                    return c
-            return None
-
-        self._svgchangesets = [SvgChangeset(rev, _get_clause(rev)) \
+        self._svgchangesets = [SvgChangeset(rev, parent.clauses.get(rev))
                                for rev in revisions]
+        # Changesets indexed by revision
+        self._rev_svgchangesets = dict((chgset._rev, chgset)
+                                       for chgset in self._svgchangesets)
 
     def export(self):
         # Export branch changesets
@@ -134,16 +131,64 @@ class SvgBranch(object):
                     revisions=revisions,
                     lastrev=self._lastrev)
 
+    def export_columns(self):
+        """Exports the branch changesets as columns: revisions are delta
+           encoded from the youngest one, clauses are run-length encoded
+           and the other attributes are sparse maps indexed by changeset
+           position.
+        """
+        revs = []
+        clauses = []
+        first = []
+        last = []
+        src = {}
+        brings = {}
+        delivers = {}
+        tags = {}
+
+        previous = None
+        for idx, chgset in enumerate(self._svgchangesets):
+            revs.append(chgset._rev if previous is None
+                        else previous - chgset._rev)
+            previous = chgset._rev
+
+            if clauses and clauses[-1][1] == chgset._clause:
+                clauses[-1][0] += 1
+            else:
+                clauses.append([1, chgset._clause])
+
+            if chgset._firstrev:
+                first.append(idx)
+            if chgset._lastrev:
+                last.append(idx)
+            if chgset._srcrev is not None:
+                src[idx] = chgset._srcrev
+            if chgset._brings:
+                brings[idx] = chgset._brings
+            if chgset._delivers:
+                delivers[idx] = chgset._delivers
+            if chgset._tags:
+                tags[idx] = chgset._tags
+
+        return dict(name=self._branch.name,
+                    path=self._branch.branch,
+                    lastrev=self._lastrev,
+                    revs=revs,
+                    clauses=clauses,
+                    first=first,
+                    last=last,
+                    src=src,
+                    brings=brings,
+                    delivers=delivers,
+                    tags=tags)
+
     def create_tag(self, tag):
         svgc = self.svgchangeset(tag.revision)
         if svgc:
             svgc.add_tag(tag)
 
     def svgchangeset(self, rev):
-        for chgset in self._svgchangesets:
-            if chgset._rev == rev:
-                return chgset
-        return None
+        return self._rev_svgchangesets.get(rev, None)
 
     def branch(self):
         return self._branch
@@ -159,6 +204,10 @@ class SvgRevtree(object):
 
     """Main object that represents the revision tree as a SVG graph"""
 
+    # Version of each branches export format, to be increased on any change
+    # of the exported data layout
+    export_versions = dict(changesets=1, columns=1)
+
     def __init__(self, env, repos, urlbase, enhancers, optimizer):
         """Construct a new SVG revision tree"""
         # Environment
@@ -169,6 +218,9 @@ class SvgRevtree(object):
         self.repos = repos
         # Range of revision to process
         self.revrange = None
+        # Displayed revisions, and their clause
+        self.revisions = []
+        self.clauses = {}
         # Optional enhancers
         self.enhancers = enhancers
         # Optimizer
@@ -178,6 +230,11 @@ class SvgRevtree(object):
                                           'trunk').split(' ')
         # Dictionary of branch widgets (branches as keys)
         self._svgbranches = {}
+        # Branch widgets indexed by revision, by branch first revision and
+        # by branch name
+        self._rev_svgbranches = {}
+        self._firstrev_svgbranches = {}
+        self._name_svgbranches = {}
         # Markers
         # List of inter branch operations
 
@@ -191,18 +248,16 @@ class SvgRevtree(object):
         """Return a branch widget, based on the revision number or the
            branch id"""
         if branchname:
-            branches = []
-            for b in self._svgbranches.iterkeys():
-                if b.branch == branchname:
-                    branches.append(self._svgbranches[b])
-            return branches
+            return list(self._name_svgbranches.get(branchname, []))
 
         if rev:
-            for b in self._svgbranches.iterkeys():
-                if rev in b.get_revisions():
-                    return self._svgbranches[b]
-            else:
-                return None
+            # REMARK: revisions out of the displayed range are looked up
+            #         once in the database
+            if rev not in self._rev_svgbranches:
+                firstrev = self.repos.get_revision_firstrev(rev)
+                self._rev_svgbranches[rev] = \
+                    self._firstrev_svgbranches.get(firstrev, None)
+            return self._rev_svgbranches[rev]
 
         return self._svgbranches.get(branch, None)
 
@@ -214,17 +269,21 @@ class SvgRevtree(object):
     def svgbranches(self):
         return self._svgbranches
 
-    def create(self, req, svgbranches, revisions, filtered_revisions, style):
+    def create(self, req, svgbranches, revisions, filtered_revisions, style,
+               tags=None):
         '''
 
         :param req:
         :param svgbranches:
         :param revisions: revisions list in reversed order
         :param style:
+        :param tags: repository tags, queried if None
         '''
 
         self.revrange = (revisions[-1][0], revisions[0][0])
         self.revisions = revisions
+        # Clause of the displayed revisions
+        self.clauses = dict(revisions)
         self.filtered_revisions = filtered_revisions
         self.max_rev = self.revrange[1]
 
@@ -234,18 +293,26 @@ class SvgRevtree(object):
             # deleted and recreated
             for branch in self.repos.get_branch(branch_name):
                 # filter if branch has got some revisions in revrange
-                brev = filter(lambda r, mn=self.revrange[0],
-                              mx=self.revrange[1]:
-                              (mn <= r <= mx) and (r not in self.filtered_revisions), branch.get_revisions())
+                branch_revisions = branch.get_revisions(self.revrange)
+                brev = [r for r in branch_revisions
+                        if r not in self.filtered_revisions]
                 if brev:
-                    self._svgbranches[branch] = SvgBranch(self, branch, style)
+                    svgbranch = SvgBranch(self, branch, style, brev)
+                    self._svgbranches[branch] = svgbranch
+                    self._firstrev_svgbranches[branch.firstrev] = svgbranch
+                    self._name_svgbranches.setdefault(branch.branch,
+                                                      []).append(svgbranch)
+                    for r in branch_revisions:
+                        self._rev_svgbranches[r] = svgbranch
 
         for enhancer in self.enhancers:
             self._addons.append(enhancer.create(self.env, req,
                                                 self.repos, self,
                                                 self.revrange,
                                                 self.filtered_revisions))
-        for tag in self.repos.get_tags():
+        if tags is None:
+            tags = self.repos.get_tags()
+        for tag in tags:
             self.env.log.info("Found tag: %r" % tag.name)
 
             # Verify revision is in range
@@ -267,8 +334,15 @@ class SvgRevtree(object):
         if not self._rendering_svgbranches:
             raise EmptyRangeError
 
-    def export(self):
-        return [brc.export() for brc in self._rendering_svgbranches]
+    def export(self, columns=False):
+        """Exports the branches to render, as changeset dictionaries or as
+           columns (see SvgBranch.export_columns)"""
+        return list(self.iter_export(columns))
+
+    def iter_export(self, columns=False):
+        """Generates the export of the branches to render, one at a time"""
+        for brc in self._rendering_svgbranches:
+            yield brc.export_columns() if columns else brc.export()
 
     def urlbase(self):
         return self.url_base
@@ -13,7 +13,11 @@
 #
 
 from genshi.builder import tag
+from collections import OrderedDict
 from revtree.api import RevtreeSystem, EmptyRangeError
+from revtree.db.catalog import RevtreeCatalog
+from revtree.db.db import DBComponent
+from revtree.db.index import RevisionIndex
 from revtree.model import Repository
 from trac.admin.api import get_console_locale
 from trac.config import (Option, IntOption, BoolOption, ListOption,
@@ -24,14 +28,22 @@ from trac.util.datefmt import (format_datetime, pretty_timedelta, to_timestamp,
                                get_date_format_hint, parse_date)
 from trac.util.text import to_unicode
 from trac.util.translation import _
-from trac.web import IRequestFilter, IRequestHandler
+from trac.web import IRequestFilter, IRequestHandler, RequestDone
 from trac.web.chrome import add_ctxtnav, add_script, add_stylesheet, \
     INavigationContributor, ITemplateProvider, add_script_data, add_warning, Chrome
 from trac.wiki import wiki_to_html
 import cProfile
+import hashlib
 import json
 import re
+import threading
 import time
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 def profiler(func):
@@ -57,23 +69,21 @@ class QueryFilter(object):
                        'revision',
                        'date',
                        'deleted_branches']
+    # Upper bound of a revision range without end
+    max_revision = 0x7fffffff
 
-    def __init__(self, env, repos, query_info):
+    def __init__(self, env, repos, query_info, timebase=None):
         self.clauses = dict()
         self._query_changeset = None
         self._query_branch = None
         self._query_clauses = None
+        self._constants = None
         self._env = env
         self._repos = repos
+        self._timebase = int(time.time()) if timebase is None else timebase
 
         self._filtered_revisions = set()
 
-        # Deleted branches, prepare revisions filter
-        self._deleted_revisions = set()
-        for branch in repos.get_branches():
-            if branch.terminalrev:
-                self._deleted_revisions.update(branch.get_revisions())
-
         # Build internal representation
         self._build(query_info)
 
@@ -89,75 +99,145 @@ class QueryFilter(object):
             self._env.log.exception(excpt)
             raise EmptyRangeError(excpt.message)
 
-    def _filter_deleted_branches(self, flag, rev):
+    @staticmethod
+    def _revision_convert(rev_str, default):
+        """Converts a revision input, default standing for a blank one"""
+        rev_str = (rev_str or '').strip()
+        if not rev_str:
+            return default
+        try:
+            return int(rev_str)
+        except ValueError:
+            raise EmptyRangeError(_("Invalid revision '%(rev)s'. ",
+                                    rev=rev_str))
+
+    def _filter_deleted_branches(self, rev, deleted):
         """
-        Filter deleted branch, if flag is True, accept all branches even if
-        deleted. Otherwise if revision is owned by deleted branch, revision
-        is rejected.
+        Filter deleted branch, if revision is owned by deleted branch,
+        revision is rejected.
 
-        :param flag:
         :param rev:
+        :param deleted: deleted branch flag of the revision
         """
 
-        if flag is True:
-            return True
-
-        if rev in self._deleted_revisions:
+        if deleted:
             self._filtered_revisions.add(rev)
             return False
 
         return True
 
-    def _build(self, query_info):
+    def _compile(self, clause):
+        """
+        Resolve clause literal values into constants: author and branch
+        names as frozensets, periods and dates as timestamp ranges.
+        None stands for a constraint which accepts all revisions.
+
+        :param clause: clause constraints
+        """
+        constants = {}
+        for name, values in clause.iteritems():
+            if name == 'author':
+                value = None if '' in values else frozenset(values)
+            elif name == 'branch':
+                value = None if 'all' in values else frozenset(values)
+            elif name == 'period':
+                periods = [int(p) for p in values]
+                value = None if 0 in periods else \
+                    [(self._timebase - p * 86400, self._timebase)
+                     for p in periods]
+            elif name == 'date':
+                value = [(self._date_convert(f), self._date_convert(t))
+                         for f, t in values]
+            elif name == 'revision':
+                value = [(self._revision_convert(f, 0),
+                          self._revision_convert(t, self.max_revision))
+                         for f, t in values]
+            elif name == 'deleted_branches':
+                value = None if 'True' in values else False
+            else:
+                value = values
+            constants[name] = value
+        return constants
+
+    @classmethod
+    def parse_clauses(cls, query_info):
+        """
+        Returns the clauses of the query request arguments, as exported by
+        export, without resolving their values.
+
+        :param query_info: query request arguments
+        """
+        clauses = {}
         for k, vals in query_info.iteritems():
-            match = self.clause_re.match(k)
+            match = cls.clause_re.match(k)
             if not match:
                 continue
             constraint = match.group('constraint')
             clause_id = match.group('clause')
-            if constraint not in self.constaint_names:
+            if constraint not in cls.constaint_names:
                 continue
             if not isinstance(vals, (list, tuple)):
                 vals = [vals]
+            if constraint == 'revision':
+                # REMARK: bounds are kept as input, once validated, blank
+                #         bounds leaving the range open (see _compile), rules
+                #         with both bounds blank are ignored
+                gen = iter(vals)
+                vals = [(v, t) for v, t in (((v or '').strip(),
+                                             (gen.next() or '').strip())
+                                            for v in gen)
+                        if v or t]
+                for v, t in vals:
+                    cls._revision_convert(v, None)
+                    cls._revision_convert(t, None)
+            elif constraint == 'date':
+                gen = iter(vals)
+                vals = [(v, gen.next()) for v in gen]
             if vals:
                 # For corresponding clause add constraint
-                clause = self.clauses.setdefault(int(clause_id), {})
-                if constraint == 'revision':
-                    gen = iter(vals)
-                    vals = [(int(v), int(gen.next())) for v in gen]
-                elif constraint == 'date':
-                    gen = iter(vals)
-                    vals = [(v, gen.next()) for v in gen]
+                clause = clauses.setdefault(int(clause_id), {})
                 clause.setdefault(constraint, []).extend(vals)
 
         # Clauses
-        self.clauses = [self.clauses[clause_id]
-                        for clause_id in sorted(self.clauses.keys())]
-        for clause in self.clauses:
+        clauses = [clauses[clause_id] for clause_id in sorted(clauses.keys())]
+        for clause in clauses:
             clause.setdefault("deleted_branches", ["False"])
+        return clauses
+
+    def _build(self, query_info):
+        # Clauses
+        self.clauses = self.parse_clauses(query_info)
+
+        # Clauses constants, resolved once
+        self._constants = [self._compile(clause) for clause in self.clauses]
+
+        namespace = dict(filter_deleted_branches=self._filter_deleted_branches)
+
+        def constant(value):
+            """
+            Register a constant in clauses namespace, returning its name
+            """
+            name = '_c%d' % len(namespace)
+            namespace[name] = value
+            return name
+
+        def ranges(name, value):
+            return " or ".join(['(%d <= %s <= %d)' % (f, name, t)
+                                for f, t in value]) or 'False'
 
         rule_query_formatter = {
-            'author': lambda v:
-              "True if '' in %s else [a for a in authors if a in %s]" % (v, v),
+            'author': lambda v: "not %s.isdisjoint(authors)" % constant(v),
 
-            'period': lambda v:
-            ' or '.join(
-                ['((( (timebase - (%d * 86400)) <= date) and (date <= '
-                 'timebase)) if %s else True)' % (int(p), int(p)) for p in v]),
+            'period': lambda v: ranges('date', v),
 
-            'branch': lambda v: "True if 'all' in %s else branch in %s" %
-            (v, v),
+            'branch': lambda v: "branch in %s" % constant(v),
 
-            'revision': lambda v:
-              " or ".join(['((%d <= rev) and (rev <= %d))' % i for i in v]),
+            'revision': lambda v: ranges('rev', v),
 
             'deleted_branches': lambda v:
-                " or ".join(['filter_deleted_branches(%s, rev)' % f for f in v]),
+                "filter_deleted_branches(rev, deleted)",
 
-            'date': lambda v:
-              " or ".join(
-                ['( (date_convert("%s") <= date) and '
-                 '  (date <= date_convert("%s")) )' % (f, t) for f, t in v]),
+            'date': lambda v: ranges('date', v),
         }
 
         def rule_query(rule_name, value):
@@ -166,26 +246,22 @@ class QueryFilter(object):
             """
             return rule_query_formatter.get(rule_name)(value)
 
-        def clause_query(clause):
+        def clause_query(constants):
             """
             Build clause query
             """
             return " and ".join(['(%s)' % rule_query(n, v)
-                                 for n, v in clause.iteritems()])
-
-        self._query_clauses = [compile(clause_query(cts), 'query', 'eval')
-                               for cts in self.clauses]
-
-    def eval(self, branch, authors, revision, date, timebase):
-        params = dict(rev=revision,
-                      date=date,
-                      branch=branch,
-                      authors=authors,
-                      timebase=timebase,
-                      date_convert=self._date_convert,
-                      filter_deleted_branches=self._filter_deleted_branches)
+                                 for n, v in constants.iteritems()
+                                 if v is not None]) or 'True'
+
+        self._query_clauses = [eval('lambda rev, date, branch, authors, '
+                                    'deleted: %s' % clause_query(constants),
+                                    namespace)
+                               for constants in self._constants]
+
+    def eval(self, branch, authors, revision, date, deleted=False):
         for idx, clause in enumerate(self._query_clauses):
-            if eval(clause, params):
+            if clause(revision, date, branch, authors, deleted):
                 # Is revision has been filtered by an other clause, restore it
                 if revision in self._filtered_revisions:
                     self._filtered_revisions.remove(revision)
@@ -193,6 +269,110 @@ class QueryFilter(object):
                 return idx + 1, True
         return None, False
 
+    def constants(self):
+        """
+        Returns the resolved constants of each clause, see `_compile`.
+        """
+        return self._constants
+
+    def predicates(self):
+        """
+        Translates each clause into a parameterized SQL predicate on the
+        revtree_revisions columns, as (sql, args) tuples. Returns None
+        when a constraint cannot be translated, clauses are then
+        evaluated through `eval`.
+        """
+        def any_of(predicates):
+            return (' OR '.join('(%s)' % sql for sql, _ in predicates) or
+                    '1=0', [arg for _, args in predicates for arg in args])
+
+        def all_of(predicates):
+            return (' AND '.join('(%s)' % sql for sql, _ in predicates) or
+                    '1=1', [arg for _, args in predicates for arg in args])
+
+        def one_of(column, values):
+            return ('%s IN (%s)' % (column, ', '.join(['%s'] * len(values))),
+                    list(values))
+
+        def between(column, value):
+            return any_of([('%s>=%%s AND %s<=%%s' % (column, column),
+                            [first, last]) for first, last in value])
+
+        rule_predicate_formatter = {
+            'author': lambda v: one_of('author', v),
+
+            'period': lambda v: between('date', v),
+
+            'branch': lambda v: one_of('branch', v),
+
+            'revision': lambda v: between('revision', v),
+
+            'deleted_branches': lambda v: ('deleted=0', []),
+
+            'date': lambda v: between('date', v),
+        }
+
+        predicates = []
+        for constants in self._constants:
+            rules = []
+            for name, value in constants.iteritems():
+                formatter = rule_predicate_formatter.get(name)
+                if formatter is None:
+                    return None
+                if value is not None:
+                    rules.append(formatter(value))
+            predicates.append(all_of(rules))
+        return predicates
+
+    def _clause_bounds(self, constants):
+        """
+        Computes the revision, date, author and branch restrictions of a
+        clause, None standing for no restriction.
+
+        :param constants: clause resolved constants
+        """
+        bounds = dict(revrange=None, daterange=None,
+                      authors=constants.get('author'),
+                      branches=constants.get('branch'))
+
+        revisions = constants.get('revision')
+        if revisions:
+            bounds['revrange'] = (min(f for f, _ in revisions),
+                                  max(t for _, t in revisions))
+
+        # REMARK: period and date constraints are both applied
+        dateranges = [(min(f for f, _ in v), max(t for _, t in v))
+                      for v in (constants.get('period'),
+                                constants.get('date')) if v]
+        if dateranges:
+            bounds['daterange'] = (max(r[0] for r in dateranges),
+                                   min(r[1] for r in dateranges))
+
+        return bounds
+
+    def pushdown(self):
+        """
+        Returns the restrictions shared by all clauses, as keyword
+        arguments of `DBInterface.get_revisions`, so that only candidate
+        revisions are read from the database.
+        """
+        bounds = [self._clause_bounds(constants)
+                  for constants in self._constants]
+        if not bounds:
+            return {}
+
+        pushdown = {}
+        for name in ('revrange', 'daterange'):
+            ranges = [b[name] for b in bounds]
+            if None not in ranges:
+                pushdown[name] = (min(r[0] for r in ranges),
+                                  max(r[1] for r in ranges))
+        for name in ('authors', 'branches'):
+            values = [b[name] for b in bounds]
+            if None not in values:
+                pushdown[name] = set().union(*values)
+        return pushdown
+
     def export(self):
         return self.clauses
 
@@ -253,6 +433,56 @@ class SessionContext(object):
         self._req.session['revtree'] = str(self._data)
 
 
+def accepted_encoding(header):
+    """Returns the preferred supported content coding of an Accept-Encoding
+       header value, or None for the identity coding.
+    """
+    accepted = set()
+    for item in (header or '').split(','):
+        params = item.strip().split(';')
+        coding = params[0].strip().lower()
+        try:
+            qvalue = float(params[1].split('=')[1]) if len(params) > 1 else 1
+        except (IndexError, ValueError):
+            qvalue = 0
+        if coding and qvalue > 0:
+            accepted.add(coding)
+    if brotli and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+class ResponseCache(object):
+    """Least recently used cache of the revtree responses, one entry per
+       response and content coding"""
+
+    def __init__(self, size, max_entry_size=None):
+        self._size = size
+        self.max_entry_size = max_entry_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        """Keeps value, unless it is larger than max_entry_size bytes"""
+        if self._size <= 0 or (self.max_entry_size is not None and
+                               len(value) > self.max_entry_size):
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+
 class RevtreeModule(Component):
 
     """Implements the revision tree feature"""
@@ -296,6 +526,26 @@ class RevtreeModule(Component):
     scale = FloatOption('revtree', 'scale', '1',
                         doc="""Default rendering scale for the SVG graph""")
 
+    query_engine = ChoiceOption('revtree', 'query_engine', 'database',
+                                'database,memory',
+                                doc="""Query filters evaluation, 'database'
+                                or 'memory'. 'memory' keeps an in-memory
+                                index of the revisions, and requires
+                                NumPy""")
+
+    compression = BoolOption('revtree', 'compression', 'true',
+                             doc="""Compress the revision tree responses
+                             with gzip, or brotli if available, when
+                             accepted by the browser""")
+
+    cache_size = IntOption('revtree', 'cache_size', '32',
+                           doc="""Number of revision tree responses kept in
+                           memory, 0 disables the cache""")
+
+    cache_max_size = IntOption('revtree', 'cache_max_size', '8192',
+                               doc="""Largest revision tree response, in
+                               kilobytes, kept in memory""")
+
     # IPermissionRequestor methods
     def get_permission_actions(self):
         return ['REVTREE_VIEW']
@@ -345,12 +595,17 @@ class RevtreeModule(Component):
         self.env.log.debug('Revtree RE: %s' % self.branchre)
         self.bcre = re.compile(self.branchre)
         self.rt = RevtreeSystem(self.env)
+        self._cache = ResponseCache(self.cache_size,
+                                    self.cache_max_size * 1024)
 
     def process_request(self, req):
         req.perm.assert_permission('REVTREE_VIEW')
         if 'autocompletion' in req.args:
             return self._process_request_completion(req)
 
+        if 'revcompletion' in req.args:
+            return self._process_revision_completion(req)
+
         # Reset clauses
 #         if req.args.get('reset'):
 #             session_ctx = SessionContext(req)
@@ -377,6 +632,44 @@ class RevtreeModule(Component):
                             href=req.href.revtree())
         return (template, data, content_type)
 
+    def _process_revision_completion(self, req):
+        '''
+        Process revision completion request.
+
+        This method is invoked when a filter revision is modified,
+        returning the youngest revisions starting with the typed digits.
+        '''
+
+        prefix = req.args.get('revcompletion', '').strip()
+
+        revisions = self._get_ui_revisions()
+        items = [tag.li(rev) for rev in
+                 self._complete_revision(prefix, revisions['min'],
+                                         revisions['max'])]
+        elem = tag.ul(items)
+
+        xhtml = elem.generate().render('xhtml', encoding='utf-8')
+        req.send_response(200)
+        req.send_header('Content-Type', "text/xml")
+        req.send_header('Content-Length', len(xhtml))
+        req.write(xhtml)
+
+    def _complete_revision(self, prefix, revmin, revmax, limit=20):
+        """Returns the youngest revisions of [revmin, revmax] starting with
+           prefix digits, at most limit ones"""
+        if not prefix.isdigit() or prefix.startswith('0'):
+            return []
+
+        revisions = []
+        first = int(prefix)
+        scale = 10 ** max(len(str(revmax)) - len(prefix), 0)
+        while scale and len(revisions) < limit:
+            high = min((first + 1) * scale - 1, revmax)
+            low = max(first * scale, revmin, high - (limit - len(revisions)) + 1)
+            revisions.extend(xrange(high, low - 1, -1))
+            scale //= 10
+        return revisions
+
     def _process_request_completion(self, req):
         '''
         Process branch name completion request.
@@ -411,6 +704,17 @@ class RevtreeModule(Component):
 
         try:
             rev = int(req.args['logrev'])
+        except ValueError as e:
+            raise TracError("Invalid revision log request: %s" % e)
+
+        # REMARK: log message may be modified by a revision property change,
+        #         and the changeset age has an hour resolution
+        generation = DBComponent(self.env).get_sync_generation()
+        etag = self._check_etag(req, '%s/%s/%s/%s' %
+                                (rev, generation, req.authname,
+                                 int(time.time()) // 3600))
+
+        try:
             repos = Repository.get_svn_repository(self.env)
             if not repos:
                 raise TracError("Revtree only supports Subversion "
@@ -431,28 +735,43 @@ class RevtreeModule(Component):
                 'message': wikimsg
             }
 
+            req.send_header('ETag', etag)
             return 'revtree_log.html', {'log': data}, 'application/xhtml+xml'
         except Exception as e:
             raise TracError("Invalid revision log request: %s" % e)
 
-    def _process_query(self, repos, query, timebase):
+    def _process_query(self, repos, query):
         """
 
         :param repos:
         :param query:
-        :param timebase:
         """
 
         # REMARK: use set assert not duplicated element
         svgbranches = set()
         revisions = []
 
+        # Clauses evaluated by the in-memory index or by the database
+        matches = None
+        if self.query_engine == 'memory':
+            matches = RevisionIndex(self.env).query(query)
+        if matches is None:
+            predicates = query.predicates()
+            if predicates is not None:
+                matches = repos.get_clause_revisions(predicates,
+                                                     **query.pushdown())
+        if matches is not None:
+            for rev, branch, clause_idx in matches:
+                svgbranches.add(branch)
+                revisions.append((rev, clause_idx))
+            return svgbranches, revisions, set()
+
         # Filtered revisions
         filtered_revisions = set()
-        for rev_item in repos.get_revisions():
+        for rev_item in repos.get_revisions(**query.pushdown()):
             clause_idx, result = query.eval(revision=rev_item.revision,
                                             date=int(rev_item.date),
-                                            timebase=timebase,
+                                            deleted=rev_item.deleted,
                                             branch=rev_item.branch,
                                             authors=[rev_item.author, ])
             if not result:
@@ -524,49 +843,64 @@ class RevtreeModule(Component):
                                                        key,
                                                        req.args[key])
 
-        # Repository object
-        repos = Repository(self.env)
-
-        if self.abstime:
-            timebase = int(time.time())
-        else:
-            youngest = repos.get_youngest_rev()
-            timebase = to_timestamp(repos.get_changeset(youngest).date)
-
         # Style options
         style = req.args.get('style', 'compact')
 
+        # Revision tree export format, 'changesets' or 'columns'
+        tree_format = req.args.get('tree_format')
+        if tree_format != 'columns':
+            tree_format = 'changesets'
+
         try:
-            # Generate query
-            query = QueryFilter(self.env,
-                                repos,
-                                req.args)
+            # REMARK: clauses are parsed without resolving their values, the
+            #         repository and the database revisions are only read
+            #         for a response which is neither revalidated nor cached
+            clauses = QueryFilter.parse_clauses(req.args)
 
             # Update session context information
-            session_ctx['query'] = query.export()
+            session_ctx['query'] = clauses
             session_ctx['style'] = style
 
-            svgbranches, revisions, filtered_revisions = \
-                self._process_query(repos,
-                                    query,
+            if self.abstime:
+                # REMARK: rounded to the minute, so that successive requests
+                #         share the response cache
+                timebase = int(time.time()) // 60 * 60
+                timekey = timebase
+            else:
+                # REMARK: the youngest revision is identified by the sync
+                #         high-water mark in the cache key
+                timebase = None
+                timekey = DBComponent(self.env).get_sync_state()[0]
+
+            encoding = None
+            if self.compression:
+                encoding = accepted_encoding(req.get_header('Accept-Encoding'))
+                req.send_header('Vary', 'Accept-Encoding')
+
+            key = self._cache_key(req, clauses, style, tree_format, timekey)
+            etag = self._check_etag(req, '%s/%s' % (key, encoding))
+
+            # REMARK: responses are cached in their sent content coding
+            entry = self._cache.get((key, encoding))
+            if entry is None:
+                # Repository object
+                repos = Repository(self.env)
+                if timebase is None:
+                    youngest = repos.get_youngest_rev()
+                    timebase = to_timestamp(repos.get_changeset(youngest).date)
+
+                # Generate query
+                query = QueryFilter(self.env,
+                                    repos,
+                                    req.args,
                                     timebase)
-            if (not svgbranches) or (not revisions):
-                raise EmptyRangeError('')
 
-            repos = Repository(self.env)
-
-            # MANDATORY: revisions must be sorted in reversed order
-            revisions.sort(reverse=True, key=lambda t: t[0])
-
-            # SVG revision tree object
-            svgrevtree = self.rt.get_revtree(repos, req)
-            svgrevtree.create(req,
-                              svgbranches,
-                              revisions,
-                              filtered_revisions,
-                              style)
-
-            svgrevtree.build()
+                svgrevtree = self._process_revtree_build(req, repos, query,
+                                                         style)
+                # REMARK: data read from the database before the headers are
+                #         sent, only the tree serialization is streamed
+                chunks = self._process_revtree_data(req, svgrevtree, style,
+                                                    tree_format)
         except EmptyRangeError as excpt:
             msg = _('Selected filters cannot '
                     'render a revision tree. %s' % excpt.message.encode('utf8'))
@@ -576,26 +910,177 @@ class RevtreeModule(Component):
             req.send_header('Content-Length', len(msg))
             req.write(msg)
         else:
-            data = dict(revisions=self._get_ui_revisions(),
-                        authors=self._get_ui_authors(),
-                        # branches=self._get_ui_branches(reverse=False),
-                        fontsize=self.env.config.get('revtree',
-                                                     'fontsize',
-                                                     '14pt'),
-                        fontfamily=self.env.config.get('revtree',
-                                                       'fontname',
-                                                       'arial'),
-                        tree=dict(brc=svgrevtree.export(),
-                                  max_rev=svgrevtree.max_rev),
-                        url=req.href(),
-                        style=style)
-            dump = json.dumps(data)
-
             # Send response
             req.send_response(200)
             req.send_header('Content-Type', "application/json")
-            req.send_header('Content-Length', len(dump))
-            req.write(dump)
+            req.send_header('ETag', etag)
+            if encoding:
+                req.send_header('Content-Encoding', encoding)
+            if entry is not None:
+                req.send_header('Content-Length', len(entry))
+                req.write(entry)
+                return
+
+            # REMARK: no Content-Length, the response is sent in chunks as
+            #         the branches are serialized
+            self._stream_response(req, key, chunks, encoding)
+
+    def _stream_response(self, req, key, chunks, encoding):
+        """
+        Writes the response chunks, compressed with encoding if any, and
+        keeps the response in cache unless it is too large.
+
+        :param req: Trac request object
+        :param key: response cache key
+        :param chunks: response chunks generator
+        :param encoding: response content coding
+        """
+
+        compressor = None
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=5)
+        elif encoding:
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+
+        # Response copy for the cache, as sent
+        parts = []
+        size = 0
+        for chunk in chunks:
+            data = chunk
+            if encoding == 'br':
+                data = compressor.process(chunk)
+            elif encoding:
+                data = compressor.compress(chunk)
+            if data:
+                req.write(data)
+
+            if parts is not None:
+                size += len(data)
+                if size > self._cache.max_entry_size:
+                    parts = None
+                else:
+                    parts.append(data)
+
+        if compressor:
+            data = compressor.finish() if encoding == 'br' \
+                else compressor.flush()
+            req.write(data)
+            if parts is not None:
+                parts.append(data)
+
+        if parts is not None:
+            self._cache.set((key, encoding), ''.join(parts))
+
+    def _check_etag(self, req, key):
+        """
+        Sends a '304 Not Modified' response if the client already has the
+        response identified by key, otherwise returns the ETag to send with
+        the response.
+
+        :param req: Trac request object
+        :param key: response identifier
+        """
+
+        etag = '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+        inm = req.get_header('If-None-Match')
+        if inm and (inm.strip() == '*' or
+                    etag in [value.strip() for value in inm.split(',')]):
+            req.send_response(304)
+            req.send_header('ETag', etag)
+            req.send_header('Content-Length', 0)
+            req.end_headers()
+            raise RequestDone
+        return etag
+
+    def _cache_key(self, req, clauses, style, tree_format, timebase):
+        """
+        Returns the response cache key of a filter request.
+
+        :param req: Trac request object
+        :param clauses: query clauses, as returned by QueryFilter.parse_clauses
+        :param style: revtree style
+        :param tree_format: revision tree export format
+        :param timebase: timestamp periods are relative to
+        """
+
+        # REMARK: periods only depend on the timebase
+        if not any('period' in clause for clause in clauses):
+            timebase = None
+        generation = DBComponent(self.env).get_sync_generation()
+        return json.dumps([clauses, style, tree_format, timebase, generation,
+                           req.href()], sort_keys=True)
+
+    def _process_revtree_build(self, req, repos, query, style):
+        """
+        Builds the revision tree of a query.
+
+        :param req: Trac request object
+        :param repos: Repository object
+        :param query: QueryFilter object
+        :param style: revtree style
+        :returns: SvgRevtree object
+        """
+
+        svgbranches, revisions, filtered_revisions = \
+            self._process_query(repos,
+                                query)
+        if (not svgbranches) or (not revisions):
+            raise EmptyRangeError('')
+
+        # MANDATORY: revisions must be sorted in reversed order
+        revisions.sort(reverse=True, key=lambda t: t[0])
+
+        # SVG revision tree object
+        svgrevtree = self.rt.get_revtree(repos, req)
+        svgrevtree.create(req,
+                          svgbranches,
+                          revisions,
+                          filtered_revisions,
+                          style,
+                          tags=RevtreeCatalog(self.env).get_tags())
+
+        svgrevtree.build()
+        return svgrevtree
+
+    def _process_revtree_data(self, req, svgrevtree, style, tree_format):
+        """
+        Returns a generator of the JSON representation of the revision tree,
+        in chunks of one branch. The revisions and authors are read at call
+        time, the generator only serializes the tree.
+
+        :param req: Trac request object
+        :param svgrevtree: SvgRevtree object
+        :param style: revtree style
+        :param tree_format: revision tree export format
+        """
+
+        data = dict(revisions=self._get_ui_revisions(),
+                    authors=self._get_ui_authors(),
+                    # branches=self._get_ui_branches(reverse=False),
+                    fontsize=self.env.config.get('revtree',
+                                                 'fontsize',
+                                                 '14pt'),
+                    fontfamily=self.env.config.get('revtree',
+                                                   'fontname',
+                                                   'arial'),
+                    url=req.href(),
+                    style=style)
+        tree = dict(format=tree_format,
+                    version=svgrevtree.export_versions[tree_format],
+                    max_rev=svgrevtree.max_rev)
+
+        # REMARK: objects are closed after the branches list
+        head = '%s, "tree": %s, "brc": [' % (json.dumps(data)[:-1],
+                                             json.dumps(tree)[:-1])
+        branches = svgrevtree.iter_export(columns=(tree_format == 'columns'))
+        return self._iter_revtree_data(head, branches)
+
+    def _iter_revtree_data(self, head, branches):
+        yield head
+        for idx, branch in enumerate(branches):
+            yield (', ' if idx else '') + json.dumps(branch)
+        yield ']}}'
 
     def _process_revtree(self, req):
         '''
@@ -694,38 +1179,22 @@ class RevtreeModule(Component):
         days = sorted(periods.keys())
         return [dict(value=str(d), name=periods[d]) for d in days]
 
-    def _get_ui_revisions(self, reverse=True):
-        """Generates the list of displayable revisions"""
-        repos = Repository(self.env)
+    def _get_ui_revisions(self):
+        """Generates the range of displayable revisions, as a dict of the
+           'min' and 'max' revisions of the repository"""
+        # REMARK: the repository bounds include the revisions which are not
+        #         synchronized yet or are not branch revisions
+        repos = Repository.get_svn_repository(self.env)
+        if not repos:
+            raise TracError("Revtree only supports Subversion repositories")
 
-        revmin = repos.get_oldest_rev()
-        revmax = repos.get_youngest_rev()
-
-        revisions = []
-        for rev in xrange(int(revmax), int(revmin) - 1, -1):
-#             if len(revisions) > 50:
-#                 if rev % 100:
-#                     continue
-#             elif len(revisions) > 30:
-#                 if rev % 20:
-#                     continue
-#             elif len(revisions) > 10:
-#                 if rev % 10:
-#                     continue
-
-            revisions.append(rev)
-
-        if revisions[-1] != int(revmin):
-            revisions.append(int(revmin))
-
-        return sorted(revisions, reverse=reverse)
+        return dict(min=int(repos.get_oldest_rev()),
+                    max=int(repos.get_youngest_rev()))
 
     def _get_ui_authors(self):
         """Generates the list of displayable authors """
-        repos = Repository(self.env)
-
         # Authors
-        authors = sorted(repos.get_authors())
+        authors = sorted(RevtreeCatalog(self.env).get_authors())
         authors.insert(0, '')
 
         return authors
@@ -746,9 +1215,7 @@ class RevtreeModule(Component):
 
     def _get_ui_branches(self, reverse=False):
         """Generates the list of displayable branches """
-        repos = Repository(self.env)
-
-        branches = repos.get_branch_names_with_prop()
+        branches = RevtreeCatalog(self.env).get_branches()
 
         branches = sorted(branches, reverse=reverse, cmp=self.cmp_func)
         branches.insert(0, ('all', None))